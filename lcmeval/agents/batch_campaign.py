@@ -0,0 +1,79 @@
+"""
+Run the ProbGen -> CodeGen pipeline in phases against the offline batch backend.
+
+Every phase replays the same fixed list of api combinations. Steps whose completions are in
+the ingested batch results are resolved, and the first unresolved step of each task is
+queued into the batch input file. Between phases, submit the input file and place the
+output next to it (see `lcmeval.utils.batch`); a campaign is done when no task is pending.
+"""
+import json
+import os
+from lcmeval.utils import CONFIG, BatchFailed, BatchPending, TELEMETRY
+from lcmeval.agents.probgen import ProbGen, RefinementFailed
+from lcmeval.agents.codegen import CodeGen
+from lcmeval.test_generation.coverage import ImplicitCTAPICoverage
+
+
+def load_tasks(cov, num_tasks):
+    """The api combinations of this campaign, sampled once and then reused by every phase."""
+    tasks_path = os.path.join(CONFIG["runs_dir"], "batch_tasks.json")
+    if os.path.exists(tasks_path):
+        with open(tasks_path) as f:
+            return json.load(f)
+    tasks = []
+    for _ in range(num_tasks):
+        api_names, _ = cov.generate_api_combination()
+        if api_names is None:
+            break
+        tasks.append(list(api_names))
+        cov.update_coverage(api_names)
+    os.makedirs(CONFIG["runs_dir"], exist_ok=True)
+    with open(tasks_path, "w") as f:
+        json.dump(tasks, f, indent=2)
+    return tasks
+
+
+def run_phase(api_file_path, n, num_tasks):
+    CONFIG["backend"] = "batch"
+    cov = ImplicitCTAPICoverage.from_csv(api_file_path, n)
+    tasks = load_tasks(cov, num_tasks)
+    probgen = ProbGen()
+    codegen = CodeGen()
+    solved, failed, pending = [], [], 0
+    for api_names in tasks:
+        try:
+            problem = probgen.generate(api_names, cov.get_api_details(api_names))
+            code = codegen.generate_code(problem, api_names)
+        except BatchPending:
+            pending += 1
+            continue
+        except RefinementFailed as error:
+            failed.append({"apis": api_names, "failure": error.refinement.failure})
+            continue
+        except BatchFailed as error:
+            # One failed request must not cost the rest of the phase
+            failed.append({"apis": api_names, "failure": f"batch: {error.error}"})
+            continue
+        check = codegen.history[-1].check
+        if check is not None and not check.ok:
+            failed.append({"apis": api_names, "failure": f"static check: {check.reason()}"})
+            continue
+        covered = cov.credit_solution(api_names, codegen.history[-1].result)
+        solved.append({"apis": api_names, "covered": list(covered), "problem": problem, "code": code})
+    codegen.close()
+
+    with open(os.path.join(CONFIG["runs_dir"], "batch_solutions.jsonl"), "w") as f:
+        for item in solved:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    with open(os.path.join(CONFIG["runs_dir"], "batch_failures.jsonl"), "w") as f:
+        for item in failed:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    TELEMETRY.dump()
+    return solved, failed, pending
+
+
+if __name__ == "__main__":
+    solved, failed, pending = run_phase("lcmeval/crawler/numpy_apis/apis.csv", 2, 20)
+    print(f"Solved {len(solved)} tasks, {len(failed)} failed, {pending} tasks are waiting for the batch.")
+    if pending:
+        print("Submit runs/batch_requests.jsonl, save the output as runs/batch_results.jsonl and run again.")
@@ -1,6 +1,13 @@
+import ast
+import asyncio
 from dataclasses import dataclass
-from typing import Optional
-from lcmeval.utils import LLM
+from typing import Generator, List, Optional, Sequence
+from lcmeval.utils import CONFIG, TELEMETRY, Completion, make_llm
+from lcmeval.agents.probgen import Request
+from lcmeval.execution.engine import ExecutionEngine
+from lcmeval.execution.fingerprint import agreement
+from lcmeval.execution.sandbox import ExecutionResult
+from lcmeval.execution.static_check import StaticReport, check_code
 
 SYSTEM_PROMPT = 'You are a NumPy expert and proficient in the usage of various APIs of NumPy.'
 
@@ -14,6 +21,14 @@ Please follow the following rules:
 3. The code should be surrounded by <code> and </code> tags.
 4. The code should be clear and concise."""
 
+RETRY_TEMPLATE = """
+
+Your previous code was rejected because {reason}:
+<code>
+{code}
+</code>
+Write the complete code again and fix this."""
+
 
 @dataclass
 class Conversation:
@@ -21,32 +36,158 @@ class Conversation:
     response: str
     code: str
     think: Optional[str] = None
+    check: Optional[StaticReport] = None  # The static check, if the apis were given
+    samples: int = 1                      # Sampled choices with this code, up to formatting
+    votes: Optional[int] = None           # Samples whose output agreed with this code, if voted
+    result: Optional[ExecutionResult] = None
+
+
+def normalized(code: str) -> str:
+    """`code` without formatting and comments, to tell candidates apart."""
+    try:
+        return ast.dump(ast.parse(code))
+    except (SyntaxError, ValueError):
+        return " ".join(code.split())
 
 
 class CodeGen:
-    def __init__(self, prompt_template=PROMPT_TEMPLATE):
+    """
+    With `samples` > 1, every request asks for that many choices (`n`), which share the
+    prompt tokens and the round trip. The distinct candidates that pass the static check are
+    executed on `engine` and the one whose output most samples agree on is kept. When the
+    engine traces calls, a single candidate is executed too, so that the chosen one always
+    carries the `result` coverage is credited from.
+    """
+    def __init__(self, prompt_template=PROMPT_TEMPLATE, llm=None, max_attempts=None, use_static_check=None,
+                 samples=None, engine=None):
         self.prompt_template = prompt_template
-        self.llm = LLM(system_prompt=SYSTEM_PROMPT)
+        self.llm = llm or make_llm(system_prompt=SYSTEM_PROMPT)
+        self.max_attempts = max_attempts or CONFIG["codegen_max_attempts"]
+        self.use_static_check = CONFIG["codegen_static_check"] if use_static_check is None else use_static_check
+        self.samples = samples or CONFIG["codegen_samples"]
+        self.engine = engine
+        self.owns_engine = False
         self.history = []
 
     def build_prompt(self, task):
         return self.prompt_template.format(task=task)
 
-    def generate_code(self, task):
+    def solve(self, task, api_names: Sequence[str] = ()) -> Generator[Request, Completion, List[Conversation]]:
+        """
+        Generate the code of `task` as a state machine, like `ProbGen.refine`, returning the
+        distinct candidates, most sampled first. With `api_names`, candidates that do not parse
+        or do not reference every api are dropped before they take an execution slot, and if
+        none is left the code is regenerated at once with the reason; after `max_attempts` the
+        last candidates are returned and their `check` tells that they failed.
+        """
         prompt = self.build_prompt(task)
-        completion = self.llm.query(prompt)
-        content = completion.choices[0].message.content
-        if not content:
-            raise ValueError("The LLM did not return any content.")
+        for attempt in range(self.max_attempts):
+            completion = yield prompt, ("</code>",), "codegen"
+            candidates = self.parse_candidates(prompt, completion)
+            if not (api_names and self.use_static_check):
+                return candidates
+            for candidate in candidates:
+                candidate.check = check_code(candidate.code, api_names)
+            passed = [candidate for candidate in candidates if candidate.check.ok]
+            if passed or attempt == self.max_attempts - 1:
+                return passed or candidates
+            rejected = candidates[0]
+            self.history.append(rejected)
+            print(f"Static check failed (attempt {attempt + 1}): {rejected.check.reason()}")
+            prompt = self.build_prompt(task) + RETRY_TEMPLATE.format(reason=rejected.check.reason(), code=rejected.code)
+
+    def execution_engine(self) -> ExecutionEngine:
+        if self.engine is None:
+            self.engine = ExecutionEngine()
+            self.owns_engine = True
+        return self.engine
+
+    def traces_calls(self) -> bool:
+        return self.engine.trace if self.engine is not None else CONFIG["exec_trace"]
+
+    def vote(self, candidates: List[Conversation], results: List[ExecutionResult]) -> Conversation:
+        """The candidate whose output the most samples agree on; failed runs do not vote."""
+        votes, winners = {}, {}
+        for candidate, result in zip(candidates, results):
+            candidate.result = result
+        for key, indices in agreement(results).items():
+            if key[0] in ("value", "stdout"):
+                votes[key] = sum(candidates[i].samples for i in indices)
+                winners[key] = candidates[indices[0]]
+        if not votes:
+            return candidates[0]
+        best = max(votes, key=votes.get)
+        winners[best].votes = votes[best]
+        return winners[best]
+
+    def choose(self, candidates: List[Conversation], results: Optional[List[ExecutionResult]] = None) -> str:
+        chosen = self.vote(candidates, results) if results else candidates[0]
+        self.history.append(chosen)
+        return chosen.code
+
+    def generate_code(self, task, api_names: Sequence[str] = ()):
+        steps = self.solve(task, api_names)
+        request = next(steps)
+        while True:
+            prompt, stop_tags, stage = request
+            completion = self.llm.query(prompt, stop_tags=stop_tags, stage=stage, n=self.samples)
+            try:
+                request = steps.send(completion)
+            except StopIteration as stop:
+                candidates = stop.value
+                break
+        if len(candidates) == 1 and not self.traces_calls():
+            return self.choose(candidates)
+        return self.choose(candidates, self.execution_engine().run_many(c.code for c in candidates))
+
+    async def generate_code_async(self, task, api_names: Sequence[str] = ()):
+        """`generate_code` on an `AsyncLLM`; candidates run in a thread, off the event loop."""
+        steps = self.solve(task, api_names)
+        request = next(steps)
+        while True:
+            prompt, stop_tags, stage = request
+            completion = await self.llm.query(prompt, stop_tags=stop_tags, stage=stage, n=self.samples)
+            try:
+                request = steps.send(completion)
+            except StopIteration as stop:
+                candidates = stop.value
+                break
+        if len(candidates) == 1 and not self.traces_calls():
+            return self.choose(candidates)
+        codes = [candidate.code for candidate in candidates]
+        results = await asyncio.get_running_loop().run_in_executor(None, self.execution_engine().run_many, codes)
+        return self.choose(candidates, results)
+
+    def parse_choice(self, prompt, content) -> Conversation:
         response = content.strip()
         if "</think>" in content:
             think, _, response = response.partition("</think>")
             code = response.partition("<code>")[2].partition("</code>")[0].strip()
-            self.history.append(Conversation(prompt, response, code, think.strip()))
-        else:
-            code = response.partition("<code>")[2].partition("</code>")[0].strip()
-            self.history.append(Conversation(prompt, response, code))
-        return code
+            return Conversation(prompt, response, code, think.strip())
+        code = response.partition("<code>")[2].partition("</code>")[0].strip()
+        return Conversation(prompt, response, code)
+
+    def parse_candidates(self, prompt, completion) -> List[Conversation]:
+        """One `Conversation` per distinct code among the choices, most sampled first."""
+        distinct = {}
+        for choice in completion.choices:
+            if not choice.message.content:
+                continue
+            candidate = self.parse_choice(prompt, choice.message.content)
+            key = normalized(candidate.code)
+            if key in distinct:
+                distinct[key].samples += 1
+            else:
+                distinct[key] = candidate
+        if not distinct:
+            raise ValueError("The LLM did not return any content.")
+        return sorted(distinct.values(), key=lambda candidate: -candidate.samples)
+
+    def close(self):
+        if self.owns_engine:
+            self.engine.close()
+            self.engine = None
+            self.owns_engine = False
 
 
 if __name__ == "__main__":
@@ -63,8 +204,10 @@ if __name__ == "__main__":
     print(f'The generated task is:\n\n{task}')
 
     codegen = CodeGen()
-    code = codegen.generate_code(task)
+    code = codegen.generate_code(task, api_names)
+    codegen.close()
     print(codegen.history[-1].prompt)
     print(f'\nThe generated code is:\n\n{code}')
 
-    cov.update_coverage((api_names))
+    print(f"Credited APIs: {cov.credit_solution(api_names, codegen.history[-1].result)}")
+    TELEMETRY.dump()
@@ -0,0 +1,100 @@
+"""
+Pipelined ProbGen -> CodeGen driver on an asyncio LLM backend.
+
+Each api combination runs its own refinement state machine (`ProbGen.refine`); the
+generator and evaluator calls of many combinations interleave on one shared `AsyncLLM`,
+whose rate limiter bounds the requests in flight. An accepted problem goes to CodeGen
+right away, so throughput is set by the endpoint's concurrency instead of one loop latency.
+"""
+import asyncio
+import contextlib
+import io
+import json
+import os
+import time
+from lcmeval.utils import CONFIG, TELEMETRY, make_async_llm
+from lcmeval.agents.probgen import SYSTEM_PROMPT, ProbGen, RefinementFailed
+from lcmeval.agents.codegen import CodeGen
+from lcmeval.test_generation.coverage import ImplicitCTAPICoverage
+
+
+class Pipeline:
+    # Attempts to sample a combination that no other in-flight task is working on
+    max_draws = 8
+
+    def __init__(self, cov, concurrency=None, in_flight=None, quiet=True):
+        self.cov = cov
+        self.llm = make_async_llm(SYSTEM_PROMPT, concurrency)
+        self.probgen = ProbGen(llm=self.llm)
+        self.codegen = CodeGen(llm=self.llm)
+        # Keep enough combinations in flight to fill the window while some parse or wait
+        self.in_flight = in_flight or 2 * (concurrency or CONFIG["concurrency"])
+        self.quiet = quiet
+        self.claimed = set()
+        self.solved = []
+        self.failed = []
+
+    def next_combination(self):
+        for _ in range(self.max_draws):
+            api_names, api_details = self.cov.generate_api_combination()
+            if api_names is None:
+                return None, {}
+            if api_names not in self.claimed:
+                self.claimed.add(api_names)
+                return api_names, api_details
+        return None, {}
+
+    async def solve(self, api_names, api_details):
+        try:
+            problem = await self.probgen.generate_async(list(api_names), api_details)
+            code = await self.codegen.generate_code_async(problem, api_names)
+        except RefinementFailed as error:
+            self.failed.append({"apis": list(api_names), "failure": error.refinement.failure})
+            return
+        except Exception as error:
+            # An empty completion, an api error after the retries or a sandbox failure ends
+            # this task, not the run
+            self.failed.append({"apis": list(api_names), "failure": f"error: {type(error).__name__}: {error}"})
+            return
+        finally:
+            self.claimed.discard(api_names)
+        check = self.codegen.history[-1].check
+        if check is not None and not check.ok:
+            # Left uncovered, to be drawn again
+            self.failed.append({"apis": list(api_names), "failure": f"static check: {check.reason()}"})
+            return
+        # What the code called, when traced, which may differ from what was asked for
+        covered = self.cov.credit_solution(api_names, self.codegen.history[-1].result)
+        self.solved.append({"apis": list(api_names), "covered": list(covered), "problem": problem, "code": code})
+
+    async def worker(self, budget):
+        while budget:
+            api_names, api_details = self.next_combination()
+            if api_names is None:
+                return
+            budget.pop()
+            await self.solve(api_names, api_details)
+
+    async def run(self, num_tasks):
+        """Solve up to `num_tasks` uncovered combinations; returns the solved and failed tasks."""
+        budget = list(range(num_tasks))
+        workers = [self.worker(budget) for _ in range(min(self.in_flight, num_tasks))]
+        # The agents print every step, which is unreadable once interleaved
+        with contextlib.redirect_stdout(io.StringIO()) if self.quiet else contextlib.nullcontext():
+            await asyncio.gather(*workers)
+        return self.solved, self.failed
+
+
+if __name__ == "__main__":
+    cov = ImplicitCTAPICoverage.from_csv("lcmeval/crawler/numpy_apis/apis.csv", 2)
+    pipeline = Pipeline(cov)
+    start = time.monotonic()
+    solved, failed = asyncio.run(pipeline.run(50))
+    elapsed = time.monotonic() - start
+    pipeline.codegen.close()
+    print(f"Solved {len(solved)} tasks, {len(failed)} failed in {elapsed:.2f}s ({len(solved) / elapsed * 3600:.0f} tasks/hour)")
+    os.makedirs(CONFIG["runs_dir"], exist_ok=True)
+    with open(os.path.join(CONFIG["runs_dir"], "pipeline_solutions.jsonl"), "w") as f:
+        for item in solved:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    TELEMETRY.dump()
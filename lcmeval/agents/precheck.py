@@ -0,0 +1,50 @@
+"""
+Local checks of a generated problem description against the mechanical parts of
+`EXPLICIT_CRITERIA`. A description that fails them gets feedback without an LLM call;
+only descriptions that pass are sent to the LLM judge.
+"""
+import re
+from typing import List, Sequence
+from lcmeval.test_generation.compat import qualified_name
+
+MIN_PROBLEM_CHARS = 40
+MAX_PROBLEM_CHARS = 1500
+
+CODE_PATTERNS = [
+    re.compile(r"```"),
+    re.compile(r"^\s*>>>", re.MULTILINE),
+    re.compile(r"^\s*(?:import\s+\w+|from\s+\w+(?:\.\w+)*\s+import\b)", re.MULTILINE),
+    re.compile(r"^\s*(?:def|class)\s+\w+\s*[(:]", re.MULTILINE),
+    re.compile(r"^\s*[A-Za-z_]\w*\s*=\s*\S", re.MULTILINE),
+    re.compile(r"^\s*print\(", re.MULTILINE),
+]
+
+NUMPY_PATTERN = re.compile(r"\b(?:numpy|np)\b", re.IGNORECASE)
+
+
+def api_mentioned(api_name: str, problem: str) -> bool:
+    """The api is mentioned by its full name, with the `np.` alias, or without the `numpy.` prefix."""
+    api_name = qualified_name(api_name)
+    short = api_name.partition(".")[2] if api_name.startswith("numpy.") else api_name
+    names = {api_name, f"np.{short}", short}
+    return any(re.search(rf"(?<![\w.]){re.escape(name)}(?!\w)", problem) for name in names if name)
+
+
+def precheck(problem: str, api_names: Sequence[str]) -> List[str]:
+    """The criteria `problem` violates, as feedback lines; empty if it may go to the judge."""
+    if not problem or not problem.strip():
+        return ["The response is empty or is not enclosed in <response> tags."]
+    problem = problem.strip()
+    issues = []
+    missing = [qualified_name(api_name) for api_name in api_names if not api_mentioned(api_name, problem)]
+    if missing:
+        issues.append(f"Mention every given API by name; missing: {', '.join(missing)}.")
+    if not NUMPY_PATTERN.search(problem):
+        issues.append("Explicitly ask the user to use numpy.")
+    if any(pattern.search(problem) for pattern in CODE_PATTERNS):
+        issues.append("Do not include any code in the task description.")
+    if len(problem) < MIN_PROBLEM_CHARS:
+        issues.append("The task description is too short to define a problem.")
+    elif len(problem) > MAX_PROBLEM_CHARS:
+        issues.append(f"Keep the task description concise, under {MAX_PROBLEM_CHARS} characters.")
+    return issues
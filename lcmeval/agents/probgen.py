@@ -1,6 +1,8 @@
-from dataclasses import dataclass
-from typing import Tuple
-from lcmeval.utils import LLM, extract_xml
+from dataclasses import dataclass, field
+from typing import Generator, List, Optional, Tuple
+from lcmeval.utils import CONFIG, TELEMETRY, Completion, extract_xml, make_llm
+from lcmeval.agents.precheck import precheck
+from lcmeval.test_generation.cards import api_card
 
 SYSTEM_PROMPT = "You are a NumPy expert and proficient in the usage of various APIs of NumPy."
 
@@ -60,14 +62,52 @@ Original task:
 """
 
 
+@dataclass
+class Attempt:
+    thoughts: str
+    problem: str
+    evaluation: Optional[str] = None
+    feedback: Optional[str] = None
+    local: bool = False  # Rejected by the local precheck, without the LLM judge
+
+
+@dataclass
+class Refinement:
+    """The generate/evaluate rounds of one api combination."""
+    api_names: List[str]
+    prompt: str
+    attempts: List[Attempt] = field(default_factory=list)
+    tokens: int = 0
+    problem: Optional[str] = None
+    failure: Optional[str] = None
+
+
+class RefinementFailed(Exception):
+    """Raised when an api combination exhausts its rounds or token budget without a PASS."""
+    def __init__(self, refinement: Refinement):
+        super().__init__(f"No accepted problem for {refinement.api_names}: {refinement.failure}")
+        self.refinement = refinement
+
+
+# (prompt, stop_tags, stage) of one LLM call requested by `ProbGen.refine`
+Request = Tuple[str, Tuple[str, ...], str]
+
+
 class ProbGen:
-    def __init__(self, system_prompt=SYSTEM_PROMPT, generator_prompt=GENERATOR_PROMPT, evaluator_prompt=EVALUATOR_PROMPT):
+    def __init__(self, system_prompt=SYSTEM_PROMPT, generator_prompt=GENERATOR_PROMPT, evaluator_prompt=EVALUATOR_PROMPT,
+                 max_rounds=None, max_tokens=None, llm=None, use_precheck=None):
         self.generator_prompt = generator_prompt
         self.evaluator_prompt = evaluator_prompt
-        self.llm = LLM(system_prompt=system_prompt)
-        self.history = []
+        self.max_rounds = max_rounds or CONFIG["probgen_max_rounds"]
+        self.max_tokens = CONFIG["probgen_max_tokens"] if max_tokens is None else max_tokens
+        self.use_precheck = CONFIG["probgen_precheck"] if use_precheck is None else use_precheck
+        self.llm = llm or make_llm(system_prompt=system_prompt)
+        self.history: List[Refinement] = []
 
     def build_prompt(self, api_names, api_details):
+        if CONFIG["api_card_tokens"]:
+            api_infos = [api_card(api_name, api_details[api_name], CONFIG["api_card_tokens"]) for api_name in api_names]
+            return self.generator_prompt.format(api_infos="\n".join(api_infos), criteria=EXPLICIT_CRITERIA)
         api_info_template = "- api_name: {api_name}\n  description: {description}\n  parameters: {parameters}"
         api_infos = []
         for api_name in api_names:
@@ -78,8 +118,10 @@ class ProbGen:
             ))
         return self.generator_prompt.format(api_infos="".join(api_infos), criteria=EXPLICIT_CRITERIA)
 
-    def generate_problem_description(self, task: str) -> Tuple[str, str]:
-        completion = self.llm.query(task)
+    def generation_request(self, task: str) -> Request:
+        return task, ("</response>",), "probgen-generate"
+
+    def parse_generation(self, completion) -> Tuple[str, str]:
         response = completion.choices[0].message.content
         if not response:
             raise ValueError("The LLM did not return any content.")
@@ -94,9 +136,15 @@ class ProbGen:
 
         return thoughts, problem_description
 
-    def evaluate_problem_description(self, task: str, problem_description: str) -> Tuple[str, str]:
+    def generate_problem_description(self, task: str) -> Tuple[str, str]:
+        prompt, stop_tags, stage = self.generation_request(task)
+        return self.parse_generation(self.llm.query(prompt, stop_tags=stop_tags, stage=stage))
+
+    def evaluation_request(self, task: str, problem_description: str) -> Request:
         evaluator_prompt = self.evaluator_prompt.format(task=task, problem_description=problem_description)
-        completion = self.llm.query(evaluator_prompt)
+        return evaluator_prompt, ("</evaluation>", "</feedback>"), "probgen-evaluate"
+
+    def parse_evaluation(self, completion) -> Tuple[str, str]:
         response = completion.choices[0].message.content
         if not response:
             raise ValueError("The LLM did not return any content.")
@@ -110,30 +158,80 @@ class ProbGen:
 
         return evaluation, feedback
 
-    def generate(self, api_names, api_details):
-        memory = []
-        chain_of_thought = []
-
+    def evaluate_problem_description(self, task: str, problem_description: str) -> Tuple[str, str]:
+        prompt, stop_tags, stage = self.evaluation_request(task, problem_description)
+        return self.parse_evaluation(self.llm.query(prompt, stop_tags=stop_tags, stage=stage))
+
+    def budget_exhausted(self, refinement: Refinement) -> Optional[str]:
+        if len(refinement.attempts) >= self.max_rounds:
+            return f"no PASS after {self.max_rounds} rounds"
+        if self.max_tokens and refinement.tokens >= self.max_tokens:
+            return f"token budget of {self.max_tokens} exhausted after {len(refinement.attempts)} rounds"
+        return None
+
+    def refine(self, api_names, api_details) -> Generator[Request, Completion, str]:
+        """
+        The refinement of one api combination as a state machine: it yields the next LLM call
+        as a `Request`, is sent the completion, and returns the accepted problem. Only the
+        latest attempt and its feedback are sent back, so every round costs about the same.
+        Attempts that fail `precheck` get its feedback without a call to the LLM judge.
+        Raises `RefinementFailed` when the rounds or the token budget run out.
+        """
         task_prompt = self.build_prompt(api_names, api_details)
+        refinement = Refinement(list(api_names), task_prompt)
+        self.history.append(refinement)
         context = ""
 
-        thoughts, problem = self.generate_problem_description(task_prompt)
-        memory.append(problem)
-        chain_of_thought.append({"thoughts": thoughts, "result": problem})
-
         while True:
-            evaluation, feedback = self.evaluate_problem_description(f"{task_prompt}\n\n{context}", problem)
-            if evaluation == "PASS":
-                return problem
-
+            prompt = f"{task_prompt}\n\n{context}" if context else task_prompt
+            completion = yield self.generation_request(prompt)
+            refinement.tokens += completion.usage.total_tokens if completion.usage else 0
+            attempt = Attempt(*self.parse_generation(completion))
+            refinement.attempts.append(attempt)
+
+            issues = precheck(attempt.problem, api_names) if self.use_precheck else []
+            if issues:
+                attempt.evaluation, attempt.feedback, attempt.local = "NEEDS_IMPROVEMENT", "\n".join(issues), True
+            else:
+                completion = yield self.evaluation_request(prompt, attempt.problem)
+                refinement.tokens += completion.usage.total_tokens if completion.usage else 0
+                attempt.evaluation, attempt.feedback = self.parse_evaluation(completion)
+            if attempt.evaluation == "PASS":
+                refinement.problem = attempt.problem
+                return attempt.problem
+
+            refinement.failure = self.budget_exhausted(refinement)
+            if refinement.failure:
+                raise RefinementFailed(refinement)
             context = "\n".join([
-                "Previous attempts:",
-                *[f"- {m}" for m in memory],
-                f"\nFeedback: {feedback}",
+                "Previous attempt:",
+                f"- {attempt.problem}",
+                f"\nFeedback: {attempt.feedback}",
             ])
-            thoughts, problem = self.generate_problem_description(f"{task_prompt}\n\n{context}")
-            memory.append(problem)
-            chain_of_thought.append({"thoughts": thoughts, "result": problem})
+
+    def generate(self, api_names, api_details):
+        """Run `refine` to completion with blocking LLM calls."""
+        steps = self.refine(api_names, api_details)
+        request = next(steps)
+        while True:
+            prompt, stop_tags, stage = request
+            completion = self.llm.query(prompt, stop_tags=stop_tags, stage=stage)
+            try:
+                request = steps.send(completion)
+            except StopIteration as stop:
+                return stop.value
+
+    async def generate_async(self, api_names, api_details):
+        """Run `refine` to completion on an `AsyncLLM`, yielding to other refinements while waiting."""
+        steps = self.refine(api_names, api_details)
+        request = next(steps)
+        while True:
+            prompt, stop_tags, stage = request
+            completion = await self.llm.query(prompt, stop_tags=stop_tags, stage=stage)
+            try:
+                request = steps.send(completion)
+            except StopIteration as stop:
+                return stop.value
 
 
 if __name__ == "__main__":
@@ -148,6 +246,11 @@ if __name__ == "__main__":
     print("\n".join(f"- {api_name}" for api_name in api_names))
 
     probgen = ProbGen()
-    problem = probgen.generate(api_names, api_details)
-    print(f"The generated problem is: {problem}")
-    cov.update_coverage(tuple(api_names))
+    try:
+        problem = probgen.generate(api_names, api_details)
+    except RefinementFailed as error:
+        print(error)
+    else:
+        print(f"The generated problem is: {problem}")
+        cov.update_coverage(tuple(api_names))
+    TELEMETRY.dump()
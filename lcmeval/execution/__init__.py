@@ -0,0 +1,24 @@
+# Only the dependency-free modules are re-exported: warm workers import this package when
+# they start, and should not pay for the LLM stack. The engine is `lcmeval.execution.engine`.
+from .fingerprint import agreement, fingerprint, outcome_key
+from .tracer import CallTracer
+from .sandbox import ExecutionResult, Limits, execute, run_in_subprocess
+from .pool import WarmPool, WarmWorker
+from .static_check import StaticReport, check_code
+from .cache import ExecutionCache
+
+__all__ = [
+    'agreement',
+    'fingerprint',
+    'outcome_key',
+    'CallTracer',
+    'ExecutionResult',
+    'Limits',
+    'execute',
+    'run_in_subprocess',
+    'WarmPool',
+    'WarmWorker',
+    'StaticReport',
+    'check_code',
+    'ExecutionCache',
+]
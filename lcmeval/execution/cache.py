@@ -0,0 +1,68 @@
+"""
+Execution outcomes by code hash, so that identical snippets run once.
+
+Only deterministic outcomes are kept: a snippet that finished or raised. Timeouts and
+crashes depend on the load of the machine and are run again.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from dataclasses import asdict
+from typing import Optional
+from lcmeval.execution.fingerprint import FLOAT_BITS
+from lcmeval.execution.sandbox import ExecutionResult, Limits
+
+CACHED_STATUSES = ("ok", "error")
+
+
+def execution_key(code: str, limits: Limits, trace: bool) -> str:
+    """The sha256 of the code and of everything else that changes its outcome."""
+    payload = json.dumps([code, asdict(limits), trace, FLOAT_BITS])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ExecutionCache:
+    """A SQLite table of `ExecutionResult`s, in memory unless `path` is given."""
+    def __init__(self, path: str = ""):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path or ":memory:", check_same_thread=False, isolation_level=None)
+        # The engine's threads share the connection
+        self.lock = threading.Lock()
+        with self.lock:
+            if path:
+                self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS executions (key TEXT PRIMARY KEY, data TEXT NOT NULL)")
+
+    def get(self, key: str) -> Optional[ExecutionResult]:
+        with self.lock:
+            row = self.conn.execute("SELECT data FROM executions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return ExecutionResult(**json.loads(row[0]))
+
+    def put(self, key: str, result: ExecutionResult):
+        if result.status not in CACHED_STATUSES:
+            return
+        data = json.dumps(result.to_dict())
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO executions (key, data) VALUES (?, ?)", (key, data))
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM executions").fetchone()[0]
+
+    def __str__(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return f"execution cache hits: {self.hits}, misses: {self.misses}, hit rate: {rate:.1f}%"
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,105 @@
+"""
+Parallel execution of generated snippets. Every snippet runs in its own sandboxed process
+(see `lcmeval.execution.sandbox`), forked from a warm worker (`lcmeval.execution.pool`) or,
+with `warm=False`, in a fresh interpreter. The engine keeps `workers` of them running at
+once and returns one `ExecutionResult` per snippet, in order. Outcomes are cached by code
+hash (`lcmeval.execution.cache`), so a snippet that already ran is not run again.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional
+from lcmeval.utils import CONFIG
+from lcmeval.execution.cache import ExecutionCache, execution_key
+from lcmeval.execution.sandbox import ExecutionResult, Limits, run_in_subprocess
+from lcmeval.execution.pool import WarmPool
+
+
+def default_limits() -> Limits:
+    return Limits(
+        timeout=CONFIG["exec_timeout"],
+        memory_mb=CONFIG["exec_memory_mb"],
+        cpu_seconds=CONFIG["exec_cpu_seconds"],
+    )
+
+
+class ExecutionEngine:
+    def __init__(self, workers: Optional[int] = None, limits: Optional[Limits] = None, warm: Optional[bool] = None,
+                 trace: Optional[bool] = None, cache: Optional[bool] = None):
+        self.workers = workers or CONFIG["exec_workers"] or os.cpu_count() or 1
+        self.limits = limits or default_limits()
+        self.trace = CONFIG["exec_trace"] if trace is None else trace
+        warm = CONFIG["exec_warm"] if warm is None else warm
+        self.warm_pool = WarmPool(
+            self.workers, self.limits, CONFIG["exec_worker_jobs"], CONFIG["exec_worker_rss_mb"],
+        ) if warm else None
+        cache = CONFIG["exec_cache"] if cache is None else cache
+        self.cache = ExecutionCache(CONFIG["exec_cache_file"]) if cache else None
+        # The children do the work; the threads only wait on them
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="lcmeval-exec")
+
+    def execute(self, code: str) -> ExecutionResult:
+        if self.warm_pool is not None:
+            return self.warm_pool.run(code, self.trace)
+        return run_in_subprocess(code, self.limits, self.trace)
+
+    def run(self, code: str) -> ExecutionResult:
+        if self.cache is None:
+            return self.execute(code)
+        key = execution_key(code, self.limits, self.trace)
+        result = self.cache.get(key)
+        if result is None:
+            result = self.execute(code)
+            self.cache.put(key, result)
+        return result
+
+    def run_many(self, codes: Iterable[str]) -> List[ExecutionResult]:
+        """Run `codes`, each distinct snippet once."""
+        codes = list(codes)
+        distinct = list(dict.fromkeys(codes))
+        results = dict(zip(distinct, self.pool.map(self.run, distinct)))
+        return [results[code] for code in codes]
+
+    def validate_history(self, history) -> List[ExecutionResult]:
+        """Run the code of every `Conversation` in a `CodeGen.history`."""
+        return self.run_many(conversation.code for conversation in history)
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        if self.warm_pool is not None:
+            self.warm_pool.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+if __name__ == "__main__":
+    base = [
+        "import numpy as np\nresult = np.bitwise_and(np.array([2, 5, 255]), np.array([3, 14, 16]))",
+        "import numpy as np\nprint(np.linalg.norm([3, 4]))",
+        "import numpy as np\nnp.insert(np.arange(6).reshape(3, 2), 1, 6, axis=1)",
+        "import numpy as np\nnp.reshape(np.arange(6), (4, 4))",
+        "while True:\n    pass",
+        "import numpy as np\nx = np.ones((1 << 20, 1 << 12))",
+        "def f(:\n    pass",
+    ]
+    # Distinct copies, identical snippets would run once
+    snippets = [f"# copy {i}\n{code}" for i in range(4) for code in base]
+    for warm in (False, True):
+        with ExecutionEngine(limits=Limits(timeout=2.0, memory_mb=1024, cpu_seconds=2), warm=warm) as engine:
+            start = time.monotonic()
+            results = engine.run_many(snippets)
+            elapsed = time.monotonic() - start
+            rerun = time.monotonic()
+            engine.run_many(snippets)
+            rerun = time.monotonic() - rerun
+        print(f"warm={warm}")
+        for code, result in zip(snippets[:7], results[:7]):
+            print(f"  {result.status:8} {result.wall_time:6.3f}s {(result.exception or result.value or result.stdout).splitlines()[-1]}")
+        print(f"  {len(snippets)} snippets on {engine.workers} workers in {elapsed:.2f}s ({len(snippets) / elapsed * 3600:.0f} per hour)")
+        print(f"  again in {rerun:.3f}s, {engine.cache}")
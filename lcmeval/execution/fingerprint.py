@@ -0,0 +1,144 @@
+"""
+Fingerprints of the values snippets produce, to compare candidate solutions without an oracle.
+
+`fingerprint` runs in the sandboxed child, next to the value, so that only a short digest
+comes back to the parent however large the array is. An array is hashed by its dtype, its
+shape and its buffer, read through a zero-copy `memoryview`. Floats are first rounded to
+`FLOAT_BITS` mantissa bits, so that results that differ only by summation order usually
+agree, and NaNs and negative zeros are made canonical. Python scalars hash like the numpy
+scalars they convert to, so `1.0`, `np.float64(1.0)` and `np.array(1.0)` agree.
+"""
+import hashlib
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+# Mantissa bits kept when hashing floats: a relative tolerance of about 2 ** -FLOAT_BITS
+FLOAT_BITS = 32
+DIGEST_SIZE = 16
+MAX_DEPTH = 32
+ADDRESS = re.compile(r" at 0x[0-9a-fA-F]+")
+
+
+def quantized(array):
+    """The float or complex `array` rounded to `FLOAT_BITS` mantissa bits, as unsigned integers."""
+    import numpy as np
+
+    if array.dtype.kind == "c":
+        array = array.view(array.real.dtype)
+    if array.dtype.itemsize > 8:
+        array = array.astype(np.float64)
+    info = np.finfo(array.dtype)
+    drop = max(info.nmant - FLOAT_BITS, 0)
+    # Adding zero turns -0.0 into 0.0
+    array = np.where(np.isnan(array), np.array(np.nan, array.dtype), array + array.dtype.type(0))
+    bits = array.view(f"u{array.dtype.itemsize}")
+    if drop:
+        unsigned = bits.dtype.type
+        bits = (bits + unsigned(1 << (drop - 1))) & unsigned(~((1 << drop) - 1) & ((1 << (8 * array.dtype.itemsize)) - 1))
+    return bits
+
+
+def update_array(digest, array, depth: int):
+    import numpy as np
+
+    if isinstance(array, np.ma.MaskedArray):
+        digest.update(b"masked|")
+        update(digest, np.ma.getmaskarray(array), depth + 1)
+        array = array.filled()
+    digest.update(f"ndarray|{array.dtype.str}|{array.shape}|".encode())
+    if array.dtype.hasobject:
+        for item in array.reshape(-1):
+            update(digest, item, depth + 1)
+        return
+    if array.dtype.kind in "fc":
+        array = quantized(array)
+    # Contiguous arrays are hashed in place; datetimes and strings through their bytes
+    flat = np.ascontiguousarray(array).reshape(-1).view(np.uint8)
+    digest.update(memoryview(flat))
+
+
+def update(digest, value, depth: int = 0):
+    if depth > MAX_DEPTH:
+        digest.update(b"...")
+        return
+    if value is None or isinstance(value, str):
+        digest.update(f"{type(value).__name__}|{value}|".encode())
+    elif isinstance(value, (bytes, bytearray)):
+        digest.update(b"bytes|")
+        digest.update(value)
+    elif type(value) is int and not -(1 << 63) <= value < (1 << 63):
+        # Beyond int64 numpy would wrap the int in an object array
+        digest.update(f"int|{value}|".encode())
+    elif isinstance(value, (bool, int, float, complex)) or type(value).__module__ == "numpy":
+        import numpy as np
+
+        array = np.asarray(value) if isinstance(value, (np.ndarray, np.generic, bool, int, float, complex)) else None
+        if array is not None and array.dtype.hasobject and array.shape == () and array.item() is value:
+            # An object array around the value itself: hashing its items would recurse on it
+            digest.update(f"{type(value).__qualname__}|{ADDRESS.sub('', repr(value))}|".encode())
+        elif array is not None:
+            update_array(digest, array, depth)
+        else:
+            # dtypes, ufuncs and the like
+            digest.update(f"{type(value).__qualname__}|{value!r}|".encode())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}|{len(value)}|".encode())
+        for item in value:
+            update(digest, item, depth + 1)
+    elif isinstance(value, dict):
+        digest.update(f"dict|{len(value)}|".encode())
+        for key in sorted(value, key=repr):
+            update(digest, key, depth + 1)
+            update(digest, value[key], depth + 1)
+    elif isinstance(value, (set, frozenset)):
+        digest.update(f"set|{len(value)}|".encode())
+        for item in sorted(value, key=repr):
+            update(digest, item, depth + 1)
+    else:
+        ndarray = getattr(value, "__array__", None)
+        if ndarray is not None and type(value).__module__.startswith("numpy"):
+            # Subclasses such as np.matrix or records
+            update_array(digest, value, depth)
+        else:
+            digest.update(f"{type(value).__qualname__}|{ADDRESS.sub('', repr(value))}|".encode())
+
+
+def fingerprint(value) -> str:
+    """A hex digest of `value` that equal results, up to float rounding, share."""
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    update(digest, value)
+    return digest.hexdigest()
+
+
+def outcome_key(result) -> Tuple[str, Optional[str]]:
+    """
+    What two runs of candidate solutions must share to agree: the produced value if there
+    is one, else the printed output, or the exception type for a failed run.
+    """
+    if result.status != "ok":
+        return result.status, (result.exception or "").split(":", 1)[0]
+    if result.fingerprint is not None:
+        return "value", result.fingerprint
+    return "stdout", hashlib.blake2b(result.stdout.encode(), digest_size=DIGEST_SIZE).hexdigest()
+
+
+def agreement(results) -> Dict[Tuple[str, Optional[str]], List[int]]:
+    """The indices of `results` grouped by `outcome_key`, the largest group first."""
+    groups = defaultdict(list)
+    for i, result in enumerate(results):
+        groups[outcome_key(result)].append(i)
+    return dict(sorted(groups.items(), key=lambda item: -len(item[1])))
+
+
+if __name__ == "__main__":
+    import numpy as np
+
+    a = np.linspace(0, 1, 1000)
+    print(fingerprint(a.sum()) == fingerprint(float(np.add.reduce(a[::-1]))))
+    print(fingerprint(1.0) == fingerprint(np.float64(1.0)) == fingerprint(np.array(1.0)))
+    print(fingerprint(np.arange(6)) == fingerprint(np.arange(6).astype(np.int32)))
+    print(fingerprint(np.arange(6).reshape(2, 3)) == fingerprint(np.arange(6).reshape(3, 2)))
+    print(fingerprint([np.nan, -0.0]) == fingerprint([float("nan"), 0.0]))
+    print(len({fingerprint(2 ** 100), fingerprint(3 ** 80), fingerprint(-10 ** 30)}) == 3)
+    print(fingerprint(np.ma.masked_array([1, 2], mask=[0, 1])), fingerprint(np.datetime64("2020-01-01")))
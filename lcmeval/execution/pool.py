@@ -0,0 +1,200 @@
+"""
+A pool of warm workers for snippet execution.
+
+Starting an interpreter and importing numpy costs more than most generated snippets take
+to run. A `WarmWorker` is a long-lived process that imports the `preload` modules once and
+then forks one child per snippet; the child inherits the loaded modules, applies the
+sandbox limits, runs the snippet and reports back through a pipe. Workers are fresh
+interpreters, so they share nothing with the (threaded, networked) parent nor re-import its
+main module, and are replaced after `max_jobs` snippets or once their memory grows past
+`max_rss_mb`.
+"""
+import gc
+import importlib
+import json
+import os
+import queue
+import resource
+import select
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import Pipe
+from multiprocessing.connection import Connection
+from typing import Sequence
+from lcmeval.execution.sandbox import PACKAGE_ROOT, ExecutionResult, Limits, child_env, execute, failed_process
+
+WORKER_COMMAND = "import sys; from lcmeval.execution.pool import worker_main; worker_main(int(sys.argv[1]), sys.argv[2:])"
+
+# Numerical libraries must not start a thread pool per worker, snippets run in parallel
+THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+
+def run_forked(code: str, limits: Limits, trace: bool = False) -> ExecutionResult:
+    """Run `code` in a forked child of this process, killed after `limits.timeout`."""
+    start = time.monotonic()
+    with tempfile.TemporaryDirectory(prefix="lcmeval-") as workdir:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(read_fd)
+                os.setsid()
+                os.chdir(workdir)
+                # Output that bypasses sys.stdout/sys.stderr is dropped
+                devnull = os.open(os.devnull, os.O_RDWR)
+                for fd in (0, 1, 2):
+                    os.dup2(devnull, fd)
+                # The snippet must not reach the worker's connection to the parent
+                os.closerange(3, write_fd)
+                os.closerange(write_fd + 1, os.sysconf("SC_OPEN_MAX"))
+                outcome = execute(code, limits, trace)
+                with os.fdopen(write_fd, "wb") as pipe:
+                    pipe.write(json.dumps(outcome.to_dict()).encode())
+            finally:
+                os._exit(0)
+
+        os.close(write_fd)
+        chunks, timed_out = [], False
+        deadline = start + limits.timeout
+        with os.fdopen(read_fd, "rb", buffering=0) as pipe:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not select.select([pipe], [], [], remaining)[0]:
+                    timed_out = True
+                    break
+                chunk = pipe.read(1 << 16)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        if timed_out:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        _, status = os.waitpid(pid, 0)
+
+    if timed_out:
+        result = ExecutionResult(status="timeout", exception=f"Wall-clock limit of {limits.timeout}s exceeded")
+    else:
+        try:
+            result = ExecutionResult(**json.loads(b"".join(chunks)))
+        except (ValueError, TypeError):
+            result = failed_process(os.waitstatus_to_exitcode(status), "")
+    result.wall_time = time.monotonic() - start
+    return result
+
+
+def worker_main(fd: int, preload: Sequence[str]):
+    conn = Connection(fd)
+    for var in THREAD_VARS:
+        os.environ.setdefault(var, "1")
+    for module in preload:
+        importlib.import_module(module)
+    # Run the sandbox once so that its lazy initialisation happens here and not in every
+    # child, and keep the collector off the preloaded objects so forks share their pages
+    execute("pass", trace=True)
+    gc.freeze()
+    # Interrupts are handled by the parent, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        code, limits, trace = job
+        result = run_forked(code, limits, trace)
+        # Replies are JSON, so the parent never unpickles what a snippet may have written
+        reply = {"result": result.to_dict(), "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+        conn.send_bytes(json.dumps(reply).encode())
+
+
+class WarmWorker:
+    def __init__(self, preload: Sequence[str]):
+        self.conn, child_conn = Pipe()
+        env = child_env()
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [PACKAGE_ROOT, env.get("PYTHONPATH")]))
+        self.process = subprocess.Popen(
+            [sys.executable, "-c", WORKER_COMMAND, str(child_conn.fileno()), *preload],
+            pass_fds=[child_conn.fileno()], env=env, stdin=subprocess.DEVNULL,
+        )
+        child_conn.close()
+        self.jobs = 0
+        self.rss_mb = 0.0
+
+    def run(self, code: str, limits: Limits, grace: float, trace: bool = False) -> ExecutionResult:
+        self.conn.send((code, limits, trace))
+        # The worker enforces the timeout itself; `grace` covers the fork and the reply
+        if not self.conn.poll(limits.timeout + grace):
+            raise TimeoutError("Worker did not reply")
+        try:
+            reply = json.loads(self.conn.recv_bytes())
+            result, self.rss_mb = ExecutionResult(**reply["result"]), float(reply["rss_mb"])
+        except (ValueError, TypeError, KeyError) as error:
+            raise EOFError(f"Malformed reply: {error!r}")
+        self.jobs += 1
+        return result
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        try:
+            self.process.wait(1)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.conn.close()
+
+
+class WarmPool:
+    """
+    `workers` warm workers; `run` blocks until one is idle, so the pool can be driven from
+    as many threads as it has workers (see `ExecutionEngine`).
+    """
+    grace = 5.0
+
+    def __init__(self, workers: int, limits: Limits, max_jobs: int = 500, max_rss_mb: float = 512,
+                 preload: Sequence[str] = ("numpy",)):
+        self.limits = limits
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.preload = tuple(preload)
+        self.idle: "queue.Queue[WarmWorker]" = queue.Queue()
+        self.workers = [WarmWorker(self.preload) for _ in range(workers)]
+        for worker in self.workers:
+            self.idle.put(worker)
+        self.recycled = 0
+        self.lock = threading.Lock()
+
+    def replace(self, worker: WarmWorker) -> WarmWorker:
+        worker.stop()
+        fresh = WarmWorker(self.preload)
+        with self.lock:
+            self.workers[self.workers.index(worker)] = fresh
+            self.recycled += 1
+        return fresh
+
+    def run(self, code: str, trace: bool = False) -> ExecutionResult:
+        worker = self.idle.get()
+        try:
+            result = worker.run(code, self.limits, self.grace, trace)
+        except (TimeoutError, EOFError, OSError) as error:
+            worker = self.replace(worker)
+            result = ExecutionResult(status="crashed", exception=f"Worker failed: {error!r}")
+        else:
+            if worker.jobs >= self.max_jobs or worker.rss_mb > self.max_rss_mb:
+                worker = self.replace(worker)
+        finally:
+            self.idle.put(worker)
+        return result
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
@@ -0,0 +1,187 @@
+"""
+Run one generated snippet under resource limits and report what happened.
+
+`execute` runs in the process that is sandboxed: it applies the `resource` limits, runs
+the code with stdout/stderr captured, and collects the exception or the value the snippet
+produced (`result` if it defines it, else the value of a trailing expression).
+`run_in_subprocess` runs it in a fresh interpreter with a wall-clock timeout.
+
+With `trace`, the numpy callables the snippet calls are recorded (see `CallTracer`). The
+value is fingerprinted in the child (see `lcmeval.execution.fingerprint`), so arrays never
+cross the process boundary.
+"""
+import ast
+import io
+import json
+import os
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from contextlib import nullcontext, redirect_stderr, redirect_stdout
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+from lcmeval.execution.fingerprint import fingerprint
+from lcmeval.execution.tracer import CallTracer, fixed_calls
+
+SNIPPET_FILENAME = "<snippet>"
+MAX_OUTPUT_CHARS = 10000
+MAX_REPR_CHARS = 1000
+# A snippet reports its value through this variable, else through a trailing expression
+RESULT_NAME = "result"
+
+
+@dataclass
+class Limits:
+    timeout: float = 10.0      # Wall-clock seconds
+    memory_mb: int = 1024      # Address space
+    cpu_seconds: int = 10      # CPU time
+    file_size_mb: int = 16     # Largest file the snippet may write
+
+
+@dataclass
+class ExecutionResult:
+    status: str = "ok"  # ok, error, timeout or crashed
+    stdout: str = ""
+    stderr: str = ""
+    exception: Optional[str] = None   # "ValueError: ...", the last line of the traceback
+    traceback: Optional[str] = None
+    value: Optional[str] = None       # repr of the produced value
+    value_type: Optional[str] = None
+    fingerprint: Optional[str] = None  # Digest of the produced value, see `fingerprint`
+    called: Optional[List[str]] = None  # Public names of the numpy callables called, if traced
+    wall_time: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit] + f"... [{len(text) - limit} more characters]"
+
+
+def set_limits(limits: Limits):
+    """Apply `limits` to the current process; only call it in the sandboxed child."""
+    if limits.memory_mb:
+        size = limits.memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (size, size))
+    if limits.cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (limits.cpu_seconds, limits.cpu_seconds + 1))
+    if limits.file_size_mb:
+        size = limits.file_size_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_FSIZE, (size, size))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def compile_snippet(code: str):
+    """Compile `code` so that the value of a trailing expression is kept, as in a REPL."""
+    tree = ast.parse(code, SNIPPET_FILENAME)
+    body, tail = tree.body, None
+    if body and isinstance(body[-1], ast.Expr):
+        tail = ast.Expression(body.pop().value)
+    return compile(tree, SNIPPET_FILENAME, "exec"), tail and compile(tail, SNIPPET_FILENAME, "eval")
+
+
+def produced_value(namespace: dict, tail_value: Any) -> Any:
+    if RESULT_NAME in namespace:
+        return namespace[RESULT_NAME]
+    return tail_value
+
+
+def execute(code: str, limits: Optional[Limits] = None, trace: bool = False) -> ExecutionResult:
+    """Run `code` in this process and return its `ExecutionResult`."""
+    if limits is not None:
+        set_limits(limits)
+    result = ExecutionResult()
+    stdout, stderr = io.StringIO(), io.StringIO()
+    namespace = {"__name__": "__main__"}
+    tracer = None
+    start = time.monotonic()
+    try:
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            body, tail = compile_snippet(code)
+            if trace:
+                fixed = fixed_calls(ast.parse(code, SNIPPET_FILENAME))
+                tracer = CallTracer(*(c for c in (body, tail) if c is not None), fixed=fixed)
+            with tracer or nullcontext():
+                exec(body, namespace)
+                tail_value = eval(tail, namespace) if tail is not None else None
+        value = produced_value(namespace, tail_value)
+        if value is not None:
+            result.value = truncate(repr(value), MAX_REPR_CHARS)
+            result.value_type = f"{type(value).__module__}.{type(value).__qualname__}"
+            result.fingerprint = fingerprint(value)
+    except BaseException as error:
+        result.status = "error"
+        result.exception = "".join(traceback.format_exception_only(type(error), error)).strip()
+        result.traceback = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+    result.wall_time = time.monotonic() - start
+    if tracer is not None:
+        result.called = tracer.names()
+    result.stdout = truncate(stdout.getvalue(), MAX_OUTPUT_CHARS)
+    result.stderr = truncate(stderr.getvalue(), MAX_OUTPUT_CHARS)
+    return result
+
+
+# The root that makes `lcmeval` importable in child interpreters
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CHILD_COMMAND = f"import sys; sys.path.insert(0, {PACKAGE_ROOT!r}); from lcmeval.execution.sandbox import main; main()"
+
+
+def child_env() -> Dict[str, str]:
+    """The environment of a sandboxed interpreter, without the LLM credentials."""
+    env = {key: value for key, value in os.environ.items() if not key.startswith(("OPENAI_", "MODEL_"))}
+    # One thread per snippet, the engine runs snippets in parallel
+    env.update(OMP_NUM_THREADS="1", OPENBLAS_NUM_THREADS="1", MKL_NUM_THREADS="1")
+    return env
+
+
+def failed_process(returncode: int, stderr: str) -> ExecutionResult:
+    if returncode < 0 and -returncode in (signal.SIGXCPU, signal.SIGKILL):
+        return ExecutionResult(status="timeout", stderr=stderr, exception="CPU time limit exceeded")
+    return ExecutionResult(status="crashed", stderr=stderr, exception=f"Interpreter exited with code {returncode}")
+
+
+def run_in_subprocess(code: str, limits: Limits, trace: bool = False) -> ExecutionResult:
+    """Run `code` in a fresh interpreter in a temporary directory, killed after `limits.timeout`."""
+    start = time.monotonic()
+    with tempfile.TemporaryDirectory(prefix="lcmeval-") as workdir:
+        with subprocess.Popen(
+            [sys.executable, "-I", "-c", CHILD_COMMAND, json.dumps({"limits": asdict(limits), "trace": trace})],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            cwd=workdir, env=child_env(), start_new_session=True,
+        ) as process:
+            try:
+                stdout, stderr = process.communicate(code, timeout=limits.timeout)
+            except subprocess.TimeoutExpired:
+                stdout = None
+            # The child leads its own session: this also kills whatever the snippet started
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            process.wait()
+        if stdout is None:
+            result = ExecutionResult(status="timeout", exception=f"Wall-clock limit of {limits.timeout}s exceeded")
+        else:
+            lines = stdout.rstrip("\n").rsplit("\n", 1)
+            try:
+                result = ExecutionResult(**json.loads(lines[-1]))
+            except (ValueError, TypeError):
+                result = failed_process(process.returncode, truncate(stderr, MAX_OUTPUT_CHARS))
+    result.wall_time = time.monotonic() - start
+    return result
+
+
+def main():
+    """Child side of `run_in_subprocess`: the code on stdin, the options as the argument."""
+    options = json.loads(sys.argv[1])
+    outcome = execute(sys.stdin.read(), Limits(**options["limits"]), options["trace"])
+    sys.stdout.write("\n" + json.dumps(outcome.to_dict()) + "\n")
@@ -0,0 +1,143 @@
+"""
+A static pass over generated code, fast enough to run inline in the pipeline.
+
+`check_code` parses a snippet, resolves numpy aliases (`import numpy as np`,
+`import numpy.linalg as la`, `from numpy import linalg, sum as total`, `from numpy import *`)
+and reports which of the target apis the code references. Methods of numpy classes
+('numpy.ndarray.reshape', 'numpy.random.Generator.integers') are counted as referenced
+by any attribute access with their name, since the receiver's type is not known statically.
+"""
+import ast
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Set
+from lcmeval.test_generation.compat import qualified_name
+
+# Lower-case numpy classes whose methods are listed as apis
+LOWERCASE_CLASSES = {
+    "ndarray", "dtype", "generic", "matrix", "recarray", "chararray", "memmap", "ufunc",
+    "flatiter", "nditer", "broadcast", "poly1d", "busdaycalendar", "record", "finfo", "iinfo",
+}
+
+
+@dataclass
+class StaticReport:
+    parses: bool
+    error: Optional[str] = None                           # The syntax error, if the code does not parse
+    referenced: List[str] = field(default_factory=list)   # Every numpy name the code references
+    used: List[str] = field(default_factory=list)         # Target apis the code references
+    missing: List[str] = field(default_factory=list)      # Target apis the code does not reference
+
+    @property
+    def ok(self) -> bool:
+        return self.parses and not self.missing
+
+    def reason(self) -> str:
+        if not self.parses:
+            return f"it does not parse ({self.error})"
+        if self.missing:
+            return f"it does not use the required APIs: {', '.join(self.missing)}"
+        return ""
+
+
+def is_method(api: str) -> bool:
+    parts = api.split(".")
+    return len(parts) > 2 and (parts[-2][:1].isupper() or parts[-2] in LOWERCASE_CLASSES)
+
+
+class NumpyReferences(ast.NodeVisitor):
+    """Collects the dotted numpy names a module references, and every attribute name."""
+    def __init__(self):
+        self.aliases: Dict[str, str] = {}
+        self.star_modules: List[str] = []
+        self.referenced: Set[str] = set()
+        self.attributes: Set[str] = set()
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            if alias.name == "numpy" or alias.name.startswith("numpy."):
+                if alias.asname:
+                    self.aliases[alias.asname] = alias.name
+                else:
+                    self.aliases["numpy"] = "numpy"
+                self.referenced.add(alias.name)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        module = node.module or ""
+        if node.level or not (module == "numpy" or module.startswith("numpy.")):
+            return
+        for alias in node.names:
+            if alias.name == "*":
+                self.star_modules.append(module)
+                continue
+            name = f"{module}.{alias.name}"
+            self.aliases[alias.asname or alias.name] = name
+            self.referenced.add(name)
+
+    def dotted(self, node: ast.AST) -> Optional[List[str]]:
+        parts = []
+        while isinstance(node, ast.Attribute):
+            parts.append(node.attr)
+            node = node.value
+        if not isinstance(node, ast.Name):
+            return None
+        parts.append(node.id)
+        return parts[::-1]
+
+    def visit_Attribute(self, node: ast.Attribute):
+        self.attributes.add(node.attr)
+        parts = self.dotted(node)
+        if parts and parts[0] in self.aliases:
+            self.referenced.add(".".join([self.aliases[parts[0]], *parts[1:]]))
+            return
+        self.generic_visit(node)
+
+    def visit_Name(self, node: ast.Name):
+        if node.id in self.aliases:
+            self.referenced.add(self.aliases[node.id])
+        else:
+            for module in self.star_modules:
+                self.referenced.add(f"{module}.{node.id}")
+
+
+def check_code(code: str, target_apis: Sequence[str] = ()) -> StaticReport:
+    """Parse `code` and report which of `target_apis` (crawled api names) it references."""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError) as error:
+        return StaticReport(parses=False, error=f"{type(error).__name__}: {error}", missing=[qualified_name(api) for api in target_apis])
+    visitor = NumpyReferences()
+    # Imports first, so that names used above a late import still resolve
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            visitor.visit(node)
+    visitor.visit(tree)
+    # A reference to numpy.linalg.norm also references numpy.linalg
+    referenced = set(visitor.referenced)
+    for name in visitor.referenced:
+        parts = name.split(".")
+        referenced.update(".".join(parts[:i]) for i in range(1, len(parts)))
+
+    used, missing = [], []
+    for api in target_apis:
+        name = qualified_name(api)
+        found = name in referenced or (is_method(name) and name.rsplit(".", 1)[1] in visitor.attributes)
+        (used if found else missing).append(name)
+    return StaticReport(parses=True, referenced=sorted(n for n in referenced if n.startswith("numpy")), used=used, missing=missing)
+
+
+if __name__ == "__main__":
+    import time
+
+    snippets = [
+        ("import numpy as np\na = np.arange(6).reshape(2, 3)\nprint(np.linalg.norm(a))", ["numpy.linalg.norm", "numpy.ndarray.reshape"]),
+        ("from numpy.linalg import norm as n\nimport numpy\nx = n(numpy.ones(3))", ["numpy.linalg.norm", "numpy.ones"]),
+        ("from numpy import *\nx = insert(arange(3), 1, 5)", ["numpy.insert", "numpy.sum"]),
+        ("import numpy as np\nx = np.ones(3\n", ["numpy.ones"]),
+    ]
+    for code, targets in snippets:
+        report = check_code(code, targets)
+        print(f"ok={report.ok} used={report.used} missing={report.missing} {report.error or ''}")
+    start = time.perf_counter()
+    for _ in range(2000):
+        check_code(snippets[0][0], snippets[0][1])
+    print(f"{2000 / (time.perf_counter() - start):.0f} snippets/s")
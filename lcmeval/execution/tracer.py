@@ -0,0 +1,197 @@
+"""
+Record the numpy callables a snippet really calls.
+
+`CallTracer` watches only the snippet's own code objects: on Python 3.12+ through
+`sys.monitoring` CALL events enabled locally on those code objects, so calls inside numpy
+or the standard library cost nothing, and a call site whose callee is fixed (a name or
+dotted name the snippet never rebinds, see `fixed_calls`) is switched off once it calls the
+same callable twice in a row, so hot loops stop paying for the tracer. Older interpreters
+fall back to `sys.setprofile` (no per-line events, unlike `sys.settrace`), which misses
+ufuncs and Cython callables and may report functions that C code calls on the snippet's
+behalf. The callables are kept as objects during the
+run and named afterwards by their public numpy path, e.g. 'numpy.linalg.norm' or
+'numpy.ndarray.reshape', the same dotted names as `compat.qualified_name` gives for the
+crawled apis.
+"""
+import ast
+import sys
+import types
+from typing import Dict, FrozenSet, Iterator, List, Set, Tuple
+
+TOOL_NAME = "lcmeval-tracer"
+
+# (lineno, end_lineno, col_offset, end_col_offset), as given by `co_positions`
+Span = Tuple[int, int, int, int]
+
+_index: Dict[int, List[str]] = {}
+_indexed_modules: Set[str] = set()
+
+
+def code_objects(code: types.CodeType) -> Iterator[types.CodeType]:
+    """`code` and the code of every function, class and comprehension nested in it."""
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            yield from code_objects(const)
+
+
+def bound_names(tree: ast.AST) -> Set[str]:
+    """The names a module assigns, takes as parameters or defines, except through imports."""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, (ast.ExceptHandler, ast.MatchAs, ast.MatchStar)) and node.name:
+            names.add(node.name)
+    return names
+
+
+def fixed_calls(tree: ast.AST) -> FrozenSet[Span]:
+    """
+    The source spans of the calls in `tree` whose callee is always the same object: a name
+    or dotted name rooted at a name bound only by imports, or a builtin, such as
+    `np.linalg.norm(a)`. `f(a)` with `f` a loop variable can call something else each time.
+    """
+    bound = bound_names(tree)
+    spans = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        root = node.func
+        while isinstance(root, ast.Attribute):
+            root = root.value
+        if isinstance(root, ast.Name) and root.id not in bound:
+            spans.add((node.lineno, node.end_lineno, node.col_offset, node.end_col_offset))
+    return frozenset(spans)
+
+
+def public_numpy_modules() -> List[Tuple[str, types.ModuleType]]:
+    return sorted(
+        (name, module) for name, module in list(sys.modules.items())
+        if module is not None and (name == "numpy" or name.startswith("numpy."))
+        and not any(part.startswith("_") for part in name.split("."))
+    )
+
+
+def index_names(obj, name: str):
+    # Python functions are also indexed by their code, which is all the profiler sees;
+    # array-function dispatchers by the code of their implementation
+    implementation = getattr(obj, "_implementation", obj)
+    code = getattr(implementation, "__code__", None)
+    for key in (id(obj), id(code)) if isinstance(code, types.CodeType) else (id(obj),):
+        _index.setdefault(key, [])
+        if name not in _index[key]:
+            _index[key].append(name)
+
+
+def update_index():
+    """Map the public numpy callables and the methods of public numpy classes to their names."""
+    for module_name, module in public_numpy_modules():
+        if module_name in _indexed_modules:
+            continue
+        _indexed_modules.add(module_name)
+        for attr, obj in list(vars(module).items()):
+            if attr.startswith("_") or isinstance(obj, types.ModuleType):
+                continue
+            index_names(obj, f"{module_name}.{attr}")
+            if isinstance(obj, type) and (obj.__module__ or "").startswith("numpy"):
+                for method, member in vars(obj).items():
+                    if method.startswith("_") and method != "__call__":
+                        continue
+                    index_names(member, f"{module_name}.{attr}.{method}")
+                    # classmethods and staticmethods are called through what getattr returns
+                    unwrapped = getattr(member, "__func__", None)
+                    if unwrapped is not None:
+                        index_names(unwrapped, f"{module_name}.{attr}.{method}")
+
+
+def callable_names(obj) -> List[str]:
+    if id(obj) in _index:
+        return _index[id(obj)]
+    owner = getattr(obj, "__self__", None)
+    if owner is not None and not isinstance(owner, types.ModuleType):
+        # A bound method: name it after the method of the owner's class
+        target = getattr(obj, "__func__", None) or getattr(type(owner), getattr(obj, "__name__", ""), None)
+        if target is not None and id(target) in _index:
+            return _index[id(target)]
+    if type(obj).__name__ == "ufunc":
+        return [f"numpy.{obj.__name__}"]
+    module = getattr(obj, "__module__", None) or ""
+    if module.startswith("numpy") and hasattr(obj, "__qualname__"):
+        return [f"{module}.{obj.__qualname__}"]
+    return []
+
+
+class CallTracer:
+    """
+    Context manager recording the callables called from `code` (a compiled snippet) while
+    it is active; `names()` then gives their public numpy names. Only the call sites in
+    `fixed` (see `fixed_calls`) are ever switched off.
+    """
+    def __init__(self, *codes: types.CodeType, fixed: FrozenSet[Span] = frozenset()):
+        self.codes = {nested for code in codes for nested in code_objects(code)}
+        self.fixed = fixed
+        self.called: Dict[int, object] = {}
+        self.last_at: Dict[Tuple[int, int], int] = {}
+        self.positions: Dict[int, List[Span]] = {}
+        self.tool = None
+        self.previous_profile = None
+
+    def is_fixed(self, code: types.CodeType, offset: int) -> bool:
+        if id(code) not in self.positions:
+            self.positions[id(code)] = list(code.co_positions())
+        # Offsets are in bytes, positions are per two-byte code unit
+        return self.positions[id(code)][offset // 2] in self.fixed
+
+    def record(self, code, offset, obj, arg0):
+        site = (id(code), offset)
+        if self.last_at.get(site) == id(obj) and self.is_fixed(code, offset):
+            return sys.monitoring.DISABLE
+        self.last_at[site] = id(obj)
+        self.called[id(obj)] = obj
+
+    def profile(self, frame, event, arg):
+        if event == "c_call":
+            if frame.f_code in self.codes:
+                self.called[id(arg)] = arg
+        elif event == "call":
+            caller = frame.f_back
+            if caller is not None and caller.f_code in self.codes:
+                self.called[id(frame.f_code)] = frame.f_code
+
+    def __enter__(self):
+        monitoring = getattr(sys, "monitoring", None)
+        if monitoring is not None and monitoring.get_tool(monitoring.PROFILER_ID) is None:
+            self.tool = monitoring.PROFILER_ID
+            monitoring.use_tool_id(self.tool, TOOL_NAME)
+            monitoring.register_callback(self.tool, monitoring.events.CALL, self.record)
+            for code in self.codes:
+                monitoring.set_local_events(self.tool, code, monitoring.events.CALL)
+        else:
+            self.previous_profile = sys.getprofile()
+            sys.setprofile(self.profile)
+        return self
+
+    def __exit__(self, *args):
+        if self.tool is not None:
+            monitoring = sys.monitoring
+            for code in self.codes:
+                monitoring.set_local_events(self.tool, code, monitoring.events.NO_EVENTS)
+            monitoring.register_callback(self.tool, monitoring.events.CALL, None)
+            monitoring.free_tool_id(self.tool)
+            # Re-arm the call sites disabled by this run for the next tracer
+            monitoring.restart_events()
+            self.tool = None
+        else:
+            sys.setprofile(self.previous_profile)
+
+    def names(self) -> List[str]:
+        update_index()
+        names = set()
+        for obj in self.called.values():
+            names.update(name for name in callable_names(obj) if name.startswith("numpy"))
+        return sorted(names)
@@ -0,0 +1,141 @@
+"""
+Compact api cards for prompts.
+
+The crawled `parameters` column is a stringified list of dicts, often thousands of
+characters long. A card condenses an api into a signature line, the first sentence of
+its description, one line per parameter and optionally one example, and is shrunk step
+by step until it fits a token budget. Cards are built once per api and cached.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+from lcmeval.test_generation.compat import parameter_sections, qualified_name
+
+# Default budget of one card, in tokens of about four characters
+CARD_TOKENS = 160
+MAX_TYPE_CHARS = 40
+MAX_EXAMPLE_CHARS = 120
+
+# The crawler dropped the space after most periods ("handled.If x1.shape ..."), so a
+# sentence also ends at a period directly followed by an upper-case letter
+SENTENCE_END = re.compile(r"(?<=[a-z0-9)\]`'])\.(?=\s|[A-Z]|$)")
+
+_cards: Dict[Tuple[str, int, bool], str] = {}
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def first_sentence(text: Optional[str], limit: Optional[int] = None) -> str:
+    text = " ".join((text or "").split())
+    match = SENTENCE_END.search(text)
+    if match:
+        text = text[:match.end()]
+    if limit and len(text) > limit:
+        text = text[:limit - 3].rstrip() + "..."
+    return text
+
+
+def short_type(type_string: Optional[str]) -> str:
+    type_string = " ".join(str(type_string or "").split())
+    return type_string if len(type_string) <= MAX_TYPE_CHARS else type_string[:MAX_TYPE_CHARS - 3] + "..."
+
+
+def is_optional(item: dict) -> bool:
+    return "optional" in str(item.get("type") or "") or str(item.get("name", "")).startswith("*")
+
+
+def signature(name: str, params: List[dict], returns: List[dict]) -> str:
+    args = [p["name"] if not is_optional(p) or p["name"].startswith("*") else f"{p['name']}=..." for p in params]
+    result = f"{name}({', '.join(args)})"
+    return_types = [short_type(r.get("type") or r.get("name")) for r in returns]
+    if return_types:
+        result += f" -> {', '.join(return_types)}"
+    return result
+
+
+def pick_example(api_name: str, examples: Optional[str]) -> Optional[str]:
+    """The first doctest statement calling the api, with the first line of its output."""
+    short = api_name.rsplit(".", 1)[-1]
+    lines = (examples or "").splitlines()
+    for i, line in enumerate(lines):
+        if not line.startswith(">>>"):
+            continue
+        statement = line[3:].strip()
+        if not re.search(rf"\b{re.escape(short)}\s*\(", statement) or statement.startswith("import "):
+            continue
+        output = lines[i + 1].strip() if i + 1 < len(lines) and not lines[i + 1].startswith((">>>", "...")) else ""
+        example = f"{statement} -> {output}" if output else statement
+        return example if len(example) <= MAX_EXAMPLE_CHARS else None
+    return None
+
+
+def render(name: str, sig: str, description: str, params: List[dict], example: Optional[str],
+           param_chars: Optional[int], optional_params: bool) -> str:
+    lines = [f"- api_name: {name}", f"  signature: {sig}", f"  description: {description}"]
+    shown = [p for p in params if optional_params or not is_optional(p)]
+    if shown:
+        lines.append("  parameters:")
+        for p in shown:
+            type_string = short_type(p.get("type"))
+            line = f"    {p['name']} ({type_string})" if type_string else f"    {p['name']}"
+            text = first_sentence(p.get("description"), param_chars)
+            lines.append(f"{line}: {text}" if text else line)
+    if example:
+        lines.append(f"  example: {example}")
+    return "\n".join(lines)
+
+
+def build_card(api_name: str, details: dict, max_tokens: int = CARD_TOKENS, example: bool = True) -> str:
+    """
+    The card of one api, dropping detail until it fits `max_tokens`: first the example,
+    then the length of parameter descriptions, then the optional parameters.
+    """
+    name = qualified_name(api_name)
+    sections = {}
+    for section in parameter_sections(details.get("parameters")):
+        if isinstance(section, dict):
+            for kind, items in section.items():
+                if isinstance(items, list):
+                    sections.setdefault(kind, []).extend(item for item in items if isinstance(item, dict) and item.get("name"))
+    params, returns = sections.get("Parameters", []), sections.get("Returns", [])
+    sig = signature(name, params, returns)
+    description = first_sentence(details.get("description"), 200)
+    sample = pick_example(name, details.get("examples")) if example else None
+
+    card = ""
+    for card_example, param_chars, optional_params in (
+        (sample, None, True),
+        (None, None, True),
+        (None, 80, True),
+        (None, 80, False),
+        (None, 40, False),
+    ):
+        card = render(name, sig, description, params, card_example, param_chars, optional_params)
+        if estimate_tokens(card) <= max_tokens:
+            return card
+    return render(name, sig, description, [], None, None, False)
+
+
+def api_card(api_name: str, details: dict, max_tokens: int = CARD_TOKENS, example: bool = True) -> str:
+    """`build_card`, cached by api name."""
+    key = (api_name, max_tokens, example)
+    if key not in _cards:
+        _cards[key] = build_card(api_name, details, max_tokens, example)
+    return _cards[key]
+
+
+def precompute_cards(apis_details_list: Dict[str, dict], max_tokens: int = CARD_TOKENS, example: bool = True) -> Dict[str, str]:
+    """Build the cards of every api up front, e.g. before forking workers."""
+    return {api_name: api_card(api_name, details, max_tokens, example) for api_name, details in apis_details_list.items()}
+
+
+if __name__ == "__main__":
+    from lcmeval.test_generation.coverage import CTAPICoverage
+
+    cov = CTAPICoverage.from_csv("lcmeval/crawler/numpy_apis/apis.csv", 1)
+    cards = precompute_cards(cov.apis_details_list)
+    raw = sum(len(d["description"]) + len(d["parameters"]) for d in cov.apis_details_list.values())
+    compact = sum(len(card) for card in cards.values())
+    print(f"{len(cards)} cards, {raw / len(cards):.0f} -> {compact / len(cards):.0f} characters per api")
+    print(cards["numpy.bitwise_and"])
@@ -0,0 +1,204 @@
+# coding=utf-8
+"""
+Persist the coverage state of `ImplicitCTAPICoverage` under `CONFIG["runs_dir"]` as a
+memory-mapped bitset, so long campaigns can be resumed after a crash or restart without
+recomputing anything.
+
+File layout: a fixed 64-byte header followed by ceil(C(N, n) / 8) bitmap bytes.
+    magic (8s) | version (I) | n (I) | number of apis (Q) | total (Q) | covered (Q) | sha256 of api list (16s)
+    | sha256 of the compatibility index (8s), all zeros when infeasible combinations are not pruned
+"""
+import hashlib
+import mmap
+import os
+import struct
+import multiprocessing
+from lcmeval.utils import CONFIG, update_config
+from lcmeval.test_generation.coverage import CoverageBitmap, ImplicitCTAPICoverage
+
+MAGIC = b'LCMCOV\x00\x01'
+VERSION = 2
+HEADER = struct.Struct('<8sIIQQQ16s8s')
+HEADER_SIZE = 64
+COVERED_OFFSET = struct.calcsize('<8sIIQQ')
+
+
+def api_list_hash(apis_names_list):
+    """The first 16 bytes of the sha256 of the sorted, de-duplicated api names."""
+    return hashlib.sha256("\n".join(sorted(set(apis_names_list))).encode()).digest()[:16]
+
+
+def compat_hash(compat):
+    """The first 8 bytes of the sha256 of the adjacency of a `CompatibilityIndex`, zeros for None."""
+    if compat is None:
+        return bytes(8)
+    width = (len(compat.apis_names_list) + 7) // 8
+    return hashlib.sha256(b"".join(mask.to_bytes(width, 'little') for mask in compat.adjacency)).digest()[:8]
+
+
+def check_version(path, magic, version):
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a coverage checkpoint")
+    if version != VERSION:
+        # Version 1 did not record pruning, so its covered count cannot be trusted either way
+        raise ValueError(f"{path} is a version {version} coverage checkpoint, expected version {VERSION}")
+
+
+def default_checkpoint_path(n):
+    return os.path.join(CONFIG["runs_dir"], f"coverage_n{n}.bin")
+
+
+class MappedCoverageBitmap(CoverageBitmap):
+    """
+    A `CoverageBitmap` whose bits live in a memory-mapped checkpoint file. Every `add`
+    also updates the covered count in the header and flushes the touched pages, so at most
+    the combination being credited is lost on a crash.
+    """
+    def __init__(self, path, apis_names_list, n, total, compat=None):
+        self.path = path
+        nbytes = (total + 7) // 8
+        digest = api_list_hash(apis_names_list)
+        pruning = compat_hash(compat)
+        num_apis = len(set(apis_names_list))
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, n, num_apis, total, 0, digest, pruning).ljust(HEADER_SIZE, b'\x00'))
+                f.truncate(HEADER_SIZE + nbytes)
+        self.file = open(path, 'r+b')
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        if len(self.mm) < HEADER_SIZE:
+            self.close()
+            raise ValueError(f"{path} is not a coverage checkpoint")
+        magic, version, file_n, file_apis, file_total, count, file_digest, file_pruning = HEADER.unpack_from(self.mm, 0)
+        try:
+            check_version(path, magic, version)
+        except ValueError:
+            self.close()
+            raise
+        if len(self.mm) != HEADER_SIZE + (file_total + 7) // 8:
+            self.close()
+            raise ValueError(f"{path} is not a coverage checkpoint")
+        if (file_n, file_apis, file_total, file_digest) != (n, num_apis, total, digest):
+            self.close()
+            raise ValueError(f"{path} was written for a different api list or n")
+        if file_pruning != pruning:
+            self.close()
+            raise ValueError(f"{path} was written with different pruning of infeasible combinations")
+        super().__init__(total, memoryview(self.mm)[HEADER_SIZE:], count=count)
+
+    def add(self, rank):
+        if not super().add(rank):
+            return False
+        struct.pack_into('<Q', self.mm, COVERED_OFFSET, self.count)
+        self.mm.flush(0, mmap.PAGESIZE)
+        page = (HEADER_SIZE + (rank >> 3)) // mmap.PAGESIZE * mmap.PAGESIZE
+        if page:
+            self.mm.flush(page, min(mmap.PAGESIZE, len(self.mm) - page))
+        return True
+
+    def flush(self):
+        self.mm.flush()
+
+    def close(self):
+        if getattr(self, 'buffer', None) is not None:
+            self.buffer.release()
+            self.buffer = None
+        self.mm.close()
+        self.file.close()
+
+
+def resume_coverage(api_file_path, n, path=None, **kwargs):
+    """
+    Build an `ImplicitCTAPICoverage` whose covered bitmap is backed by the checkpoint at
+    `path` (default: `<runs_dir>/coverage_n<n>.bin`), creating the checkpoint if needed.
+    Remaining keyword arguments are passed to `ImplicitCTAPICoverage.from_csv`; the
+    checkpoint must have been written with the same `prune_infeasible`.
+    """
+    path = path or default_checkpoint_path(n)
+    coverage = ImplicitCTAPICoverage.from_csv(api_file_path, n, **kwargs)
+    coverage.covered = MappedCoverageBitmap(path, coverage.apis_names_list, n, coverage.total, coverage.compat)
+    return coverage
+
+
+def merge_checkpoints(paths, output_path, chunk_size=1 << 20):
+    """
+    OR the coverage bitmaps of several checkpoints (e.g. one per shard node) into a global
+    checkpoint at `output_path`, which `resume_coverage(..., path=output_path)` can read.
+    All inputs must have been written for the same api list, n and pruning. Return the
+    covered count.
+    """
+    if not paths:
+        raise ValueError("No checkpoints to merge")
+    headers = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            header = HEADER.unpack(f.read(HEADER.size))
+        check_version(path, header[0], header[1])
+        headers.append(header)
+    magic, version, n, num_apis, total, _, digest, pruning = headers[0]
+    for path, header in zip(paths, headers):
+        if (header[2], header[3], header[4], header[6]) != (n, num_apis, total, digest):
+            raise ValueError(f"{path} was written for a different api list or n than {paths[0]}")
+        if header[7] != pruning:
+            raise ValueError(f"{path} was written with different pruning than {paths[0]}")
+
+    nbytes = (total + 7) // 8
+    covered = 0
+    inputs = [open(path, 'rb') for path in paths]
+    try:
+        with open(output_path, 'wb') as out:
+            out.write(bytes(HEADER_SIZE))
+            for f in inputs:
+                f.seek(HEADER_SIZE)
+            for start in range(0, nbytes, chunk_size):
+                size = min(chunk_size, nbytes - start)
+                merged = 0
+                for f in inputs:
+                    merged |= int.from_bytes(f.read(size), 'little')
+                covered += merged.bit_count()
+                out.write(merged.to_bytes(size, 'little'))
+            out.seek(0)
+            out.write(HEADER.pack(magic, version, n, num_apis, total, covered, digest, pruning))
+    finally:
+        for f in inputs:
+            f.close()
+    return covered
+
+
+def _shard_worker(api_file_path, n, runs_dir, index, count, steps):
+    update_config(CONFIG, {"runs_dir": runs_dir})
+    coverage = resume_coverage(api_file_path, n)
+    coverage.set_shard(index, count)
+    for _ in range(steps):
+        target_apis_names, _ = coverage.generate_api_combination()
+        if target_apis_names is None:
+            break
+        coverage.update_coverage(target_apis_names)
+    print(f"Shard {index}/{count}: {coverage.calculate_coverage():.2f}% of its slice ({runs_dir})")
+    coverage.covered.close()
+
+
+if __name__ == "__main__":
+    api_file_path = "lcmeval/crawler/numpy_apis/apis.csv"
+    coverage = resume_coverage(api_file_path, 2)
+    print(f"Resumed coverage: {coverage.calculate_coverage():.4f}% ({len(coverage.covered)}/{coverage.total})")
+    target_apis_names, _ = coverage.generate_api_combination()
+    coverage.update_coverage(target_apis_names)
+    print(f"Covered {target_apis_names}, coverage is now {coverage.calculate_coverage():.4f}%")
+
+    # Simulate a sharded campaign: one process per node, each with its own runs_dir
+    shards = 3
+    runs_dirs = [os.path.join(CONFIG["runs_dir"], f"shard_{i}") for i in range(shards)]
+    nodes = [
+        multiprocessing.Process(target=_shard_worker, args=(api_file_path, 2, runs_dir, i, shards, 1000))
+        for i, runs_dir in enumerate(runs_dirs)
+    ]
+    for node in nodes:
+        node.start()
+    for node in nodes:
+        node.join()
+    merged_path = os.path.join(CONFIG["runs_dir"], "coverage_n2.merged.bin")
+    merge_checkpoints([os.path.join(runs_dir, "coverage_n2.bin") for runs_dir in runs_dirs], merged_path)
+    merged = resume_coverage(api_file_path, 2, path=merged_path)
+    print(f"Merged coverage: {merged.calculate_coverage():.4f}% ({len(merged.covered)}/{merged.total})")
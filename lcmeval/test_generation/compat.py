@@ -0,0 +1,223 @@
+# coding=utf-8
+"""
+A compatibility index over the API signatures in apis.csv, used to prune combinations of
+APIs that cannot realistically appear in one task (e.g. `numpy.typing` aliases together
+with random bit generators).
+
+Every API is reduced to a submodule and to the type classes of its required parameters
+(inputs) and of its returns (outputs). Two APIs are compatible if they live in the same
+submodule, if the output of one can feed the other, or if both consume the same kind of
+data. A combination is feasible if all of its APIs are pairwise compatible.
+"""
+import ast
+import math
+import re
+from dataclasses import dataclass
+from typing import FrozenSet
+
+# Submodules whose APIs only make sense together with APIs of the same submodule
+ISOLATED_SUBMODULES = {'typing', 'exceptions'}
+
+# Ordered (type class, pattern) rules applied to the lowercased `type` of a parameter/return
+TYPE_CLASSES = [
+    ('series', re.compile(r'series|polynomial|poly1d|chebyshev|hermite|laguerre|legendre')),
+    ('generator', re.compile(r'generator|randomstate|seedsequence|pcg64|mt19937|philox|sfc64')),
+    ('string', re.compile(r'\bstr\b|string|bytes|chararray')),
+    ('dtype', re.compile(r'dtype|data-type')),
+    ('array', re.compile(r'ndarray|array|matrix|sequence|\blist\b|tuple')),
+    ('scalar', re.compile(r'\bint|float|complex|scalar|bool|number')),
+]
+
+# Type classes strong enough that two APIs consuming them can work on the same data
+DATA_CLASSES = {'array', 'series', 'string', 'generator'}
+
+
+@dataclass(frozen=True)
+class ApiSignature:
+    submodule: str
+    inputs: FrozenSet[str]
+    outputs: FrozenSet[str]
+
+
+def qualified_name(api_name):
+    """
+    The dotted name of a crawled api entry:
+    'class numpy.random.PCG64(seed=None)' -> 'numpy.random.PCG64', 'class numpy.typing.NBitBase[source]' ->
+    'numpy.typing.NBitBase', 'numpy.typing.ArrayLike = typing.Union[...]' -> 'numpy.typing.ArrayLike'.
+    """
+    return re.sub(r'^class\s+', '', api_name.strip()).split('(')[0].split('[')[0].split(' ')[0]
+
+
+def api_submodule(api_name):
+    """
+    'numpy.linalg.norm' -> 'linalg', 'class numpy.random.PCG64(seed=None)' -> 'random',
+    top-level functions and ndarray methods -> 'numpy'.
+    """
+    parts = qualified_name(api_name).split('.')
+    if len(parts) > 2 and parts[1] != 'ndarray':
+        return parts[1]
+    return 'numpy'
+
+
+def type_classes(type_string):
+    if not type_string:
+        return set()
+    type_string = str(type_string).lower()
+    return {type_class for type_class, pattern in TYPE_CLASSES if pattern.search(type_string)}
+
+
+def parameter_sections(parameters):
+    """Parse the stringified `parameters` column: a list of {section name: [items]} dicts."""
+    try:
+        sections = ast.literal_eval(parameters) if parameters else []
+    except (ValueError, SyntaxError):
+        return []
+    return sections if isinstance(sections, list) else []
+
+
+def api_signature(api_name, parameters):
+    """Build the `ApiSignature` of an api from its stringified `parameters` column."""
+    sections = parameter_sections(parameters)
+    inputs, outputs = set(), set()
+    for section in sections:
+        for kind, items in section.items():
+            if kind not in ('Parameters', 'Returns') or not isinstance(items, list):
+                continue
+            for item in items:
+                type_string = str(item.get('type') or '')
+                if kind == 'Returns':
+                    outputs |= type_classes(type_string)
+                elif 'optional' not in type_string:
+                    inputs |= type_classes(type_string)
+    return ApiSignature(api_submodule(api_name), frozenset(inputs), frozenset(outputs))
+
+
+def signatures_compatible(a, b):
+    if a.submodule == b.submodule:
+        return True
+    if a.submodule in ISOLATED_SUBMODULES or b.submodule in ISOLATED_SUBMODULES:
+        return False
+    return bool(a.outputs & b.inputs or b.outputs & a.inputs or a.inputs & b.inputs & DATA_CLASSES)
+
+
+class CompatibilityIndex(object):
+    """
+    Precomputed pairwise compatibility of the apis, stored as one adjacency bitmask (a Python
+    int over the sorted api list) per api. Signatures are compared once per distinct pair of
+    signatures, not once per pair of apis.
+    """
+    def __init__(self, apis_details_list):
+        self.apis_names_list = sorted(apis_details_list)
+        self.api_index = {api_name: i for i, api_name in enumerate(self.apis_names_list)}
+        self.signatures = {
+            api_name: api_signature(api_name, apis_details_list[api_name].get('parameters'))
+            for api_name in self.apis_names_list
+        }
+        groups = {}
+        for i, api_name in enumerate(self.apis_names_list):
+            groups.setdefault(self.signatures[api_name], 0)
+            groups[self.signatures[api_name]] |= 1 << i
+        group_adjacency = {
+            a: sum(mask for b, mask in groups.items() if signatures_compatible(a, b))
+            for a in groups
+        }
+        self.adjacency = [
+            group_adjacency[self.signatures[api_name]] & ~(1 << i)
+            for i, api_name in enumerate(self.apis_names_list)
+        ]
+
+    def compatible(self, a, b):
+        return bool(self.adjacency[self.api_index[a]] >> self.api_index[b] & 1)
+
+    def is_feasible(self, combination):
+        indices = [self.api_index[api_name] for api_name in combination]
+        return all(
+            self.adjacency[i] >> j & 1
+            for pos, i in enumerate(indices)
+            for j in indices[pos + 1:]
+        )
+
+    def iter_feasible(self, k):
+        """Yield every feasible k-combination as a tuple of api names in sorted order."""
+        def extend(prefix, candidates):
+            if len(prefix) == k:
+                yield tuple(self.apis_names_list[i] for i in prefix)
+                return
+            while candidates:
+                low = candidates & -candidates
+                i = low.bit_length() - 1
+                candidates ^= low
+                # Only extend with higher indices so every combination is produced once
+                yield from extend(prefix + [i], candidates & self.adjacency[i])
+
+        yield from extend([], (1 << len(self.apis_names_list)) - 1)
+
+    def count_cliques(self, k, candidates):
+        """Count the k-subsets of the `candidates` bitmask whose apis are pairwise compatible."""
+        if k <= 0:
+            return 1
+        if k == 1:
+            return candidates.bit_count()
+        total = 0
+        while candidates:
+            low = candidates & -candidates
+            i = low.bit_length() - 1
+            candidates ^= low
+            total += self.count_cliques(k - 1, candidates & self.adjacency[i])
+        return total
+
+    def count_feasible(self, k):
+        """Count the feasible k-combinations without enumerating the last level."""
+        return self.count_cliques(k, (1 << len(self.apis_names_list)) - 1)
+
+    def count_feasible_below(self, k, rank):
+        """
+        Count the feasible k-combinations whose colex rank (see `coverage.comb_rank`) is below
+        `rank`. Combinations with top index t hold the ranks [C(t, k), C(t + 1, k)), so every
+        top index but the one `rank` falls in is counted whole.
+        """
+        def below(k, rank, candidates):
+            if k == 0:
+                return int(rank > 0)
+            allowed = candidates
+            total = 0
+            while candidates:
+                low = candidates & -candidates
+                t = low.bit_length() - 1
+                candidates ^= low
+                first = math.comb(t, k)
+                if first >= rank:
+                    break
+                lower = (low - 1) & self.adjacency[t] & allowed
+                if math.comb(t + 1, k) <= rank:
+                    total += self.count_cliques(k - 1, lower)
+                else:
+                    total += below(k - 1, rank - first, lower)
+            return total
+
+        return below(k, rank, (1 << len(self.apis_names_list)) - 1)
+
+
+if __name__ == "__main__":
+    import bisect
+    import csv
+    import random
+    from itertools import combinations
+
+    with open("lcmeval/crawler/numpy_apis/apis.csv") as f:
+        rows = list(csv.DictReader(f))
+    random.seed(0)
+    apis_details_list = {row['api_name']: row for row in random.sample(rows, 60)}
+    compat = CompatibilityIndex(apis_details_list)
+    # Brute force: the colex ranks of every feasible combination, in order
+    for k in (2, 3, 4):
+        ranks = sorted(
+            sum(math.comb(c, i) for i, c in enumerate(indices, start=1))
+            for indices in combinations(range(len(compat.apis_names_list)), k)
+            if all(compat.adjacency[a] >> b & 1 for a, b in combinations(indices, 2))
+        )
+        total = math.comb(len(compat.apis_names_list), k)
+        assert compat.count_feasible(k) == len(ranks)
+        for rank in [0, 1, total // 3, total] + [random.randrange(total + 1) for _ in range(200)]:
+            assert compat.count_feasible_below(k, rank) == bisect.bisect_left(ranks, rank), (k, rank)
+        print(f"k={k}: {len(ranks)}/{total} feasible, count_feasible_below matches brute force")
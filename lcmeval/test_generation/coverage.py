@@ -5,10 +5,16 @@ Also, producing the selected apis based on the coverage
 """
 from itertools import combinations
 from multiprocessing import Pool
+from array import array
 import itertools
 import random
+import json
+import math
 import os
 import csv
+import re
+from functools import cached_property
+from lcmeval.test_generation.compat import CompatibilityIndex, qualified_name
 
 def generate_combinations(args):
     fixed_element, rest_elements, k = args
@@ -33,24 +39,298 @@ def parallel_combinations(elements, k):
     
     return set([combo for sublist in results for combo in sublist])
 
+def comb_rank(indices):
+    """
+    Rank a combination in the combinatorial number system (colex order).
+    `indices` are distinct positions into the sorted api list, in any order.
+    """
+    return sum(math.comb(c, i) for i, c in enumerate(sorted(indices), start=1))
+
+def comb_unrank(rank, k, n):
+    """
+    Inverse of `comb_rank`: return the sorted indices (out of `n` elements) of the
+    k-combination at `rank`.
+    """
+    indices = []
+    hi = n
+    for i in range(k, 0, -1):
+        # Largest c < hi with C(c, i) <= rank
+        lo, up = i - 1, hi - 1
+        while lo < up:
+            mid = (lo + up + 1) // 2
+            if math.comb(mid, i) <= rank:
+                lo = mid
+            else:
+                up = mid - 1
+        indices.append(lo)
+        rank -= math.comb(lo, i)
+        hi = lo
+    return indices[::-1]
+
+# A bitmap byte with at least one unset rank
+NOT_FULL = re.compile(rb'[^\xff]')
+
+class CoverageBitmap(object):
+    """
+    A compact bitset over combination ranks, one bit per combination.
+    `buffer` can be any writable bytes-like object of at least ceil(size / 8) bytes.
+    """
+    def __init__(self, size, buffer=None, count=None):
+        self.size = size
+        self.nbytes = (size + 7) // 8
+        self.buffer = bytearray(self.nbytes) if buffer is None else buffer
+        if count is None:
+            count = int.from_bytes(self.buffer[:self.nbytes], 'little').bit_count()
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, rank):
+        return bool(self.buffer[rank >> 3] & (1 << (rank & 7)))
+
+    def add(self, rank):
+        """Set the bit at `rank`, return True if it was not set before."""
+        byte, mask = rank >> 3, 1 << (rank & 7)
+        if self.buffer[byte] & mask:
+            return False
+        self.buffer[byte] |= mask
+        self.count += 1
+        return True
+
+    def iter_clear(self, start=0, stop=None):
+        """Yield every unset rank of the bytes [start, stop) in increasing order."""
+        stop = self.nbytes if stop is None else min(stop, self.nbytes)
+        # Full bytes are skipped by the regex engine, without a Python loop over them
+        for match in NOT_FULL.finditer(self.buffer, start, stop):
+            byte = match.start()
+            value = self.buffer[byte]
+            for bit in range(8):
+                rank = (byte << 3) | bit
+                if rank < self.size and not value & (1 << bit):
+                    yield rank
+
+    def is_full(self, start, stop):
+        """Whether every rank in [start, stop) is set."""
+        first, last = start >> 3, (stop - 1) >> 3
+        if first == last:
+            mask = ((1 << (stop - start)) - 1) << (start & 7)
+            return self.buffer[first] & mask == mask
+        head = (0xff << (start & 7)) & 0xff
+        tail = (1 << ((stop - 1) & 7) + 1) - 1
+        return (self.buffer[first] & head == head and self.buffer[last] & tail == tail
+                and NOT_FULL.search(self.buffer, first + 1, last) is None)
+
+class UncoveredPool(object):
+    """
+    A set of uncovered combinations that supports O(1) add, remove and uniform sampling.
+    Items live in a dense list; removal swaps the last item into the freed slot and a
+    position map keeps track of where every item is.
+    """
+    def __init__(self, items=()):
+        self.items = list(items)
+        self.positions = {item: i for i, item in enumerate(self.items)}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.positions
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def add(self, item):
+        if item not in self.positions:
+            self.positions[item] = len(self.items)
+            self.items.append(item)
+
+    def remove(self, item):
+        i = self.positions.pop(item)
+        last = self.items.pop()
+        if i < len(self.items):
+            self.items[i] = last
+            self.positions[last] = i
+
+    def discard(self, item):
+        if item in self.positions:
+            self.remove(item)
+
+    def sample(self):
+        return self.items[random.randrange(len(self.items))]
+
+class FenwickSampler(object):
+    """
+    Weighted sampling without replacement over indices 0..size-1. A Fenwick (binary indexed)
+    tree over the weights makes both drawing an index and removing it O(log size).
+
+    Removals update the tree by subtracting, which cancels badly when weights span many
+    orders of magnitude (they are products of api scores). The tree is rebuilt from the
+    weights once the total has shrunk by 2 ** `cancelled_bits` since the last build, so the
+    error of every node stays below 2 ** (`cancelled_bits` - 52) of the current total, and a
+    run over weights spanning 10 ** 18 rebuilds about three times.
+    """
+    cancelled_bits = 20
+    max_redraws = 4
+
+    def __init__(self, weights):
+        self.weights = array('d', weights)
+        self.size = len(self.weights)
+        self.count = sum(1 for w in self.weights if w > 0)
+        self.build()
+
+    def build(self):
+        self.tree = array('d', [0.0]) + self.weights
+        for i in range(1, self.size + 1):
+            j = i + (i & -i)
+            if j <= self.size:
+                self.tree[j] += self.tree[i]
+        self.total = math.fsum(self.weights)
+        self.rebuild_below = math.ldexp(self.total, -self.cancelled_bits)
+
+    def __len__(self):
+        return self.count
+
+    def set(self, index, weight):
+        delta = weight - self.weights[index]
+        if delta == 0:
+            return
+        if self.weights[index] > 0:
+            self.count -= 1
+        if weight > 0:
+            self.count += 1
+        self.weights[index] = weight
+        self.total += delta
+        if self.total < self.rebuild_below:
+            self.build()
+            return
+        self.rebuild_below = max(self.rebuild_below, math.ldexp(self.total, -self.cancelled_bits))
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def remove(self, index):
+        self.set(index, 0.0)
+
+    def draw(self):
+        target = random.random() * self.total
+        pos = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] <= target:
+                pos = nxt
+                target -= self.tree[nxt]
+            step >>= 1
+        return pos
+
+    def sample(self):
+        """Draw an index with probability proportional to its weight, or None if all weights are 0."""
+        if self.count == 0:
+            return None
+        for _ in range(self.max_redraws):
+            pos = self.draw()
+            if pos < self.size and self.weights[pos] > 0:
+                return pos
+            # Rounding landed on a removed index or past the end: rebuild and draw again
+            self.build()
+        return next(i for i in range(self.size) if self.weights[i] > 0)
+
+class WeightedPool(object):
+    """
+    A set of uncovered combinations sampled proportionally to their weights, with the same
+    interface as `UncoveredPool`.
+    """
+    def __init__(self, items, weight_fn):
+        self.items = list(items)
+        self.positions = {item: i for i, item in enumerate(self.items)}
+        self.weight_fn = weight_fn
+        self.sampler = FenwickSampler(weight_fn(item) for item in self.items)
+        self.removed = set()
+
+    def __len__(self):
+        return len(self.positions) - len(self.removed)
+
+    def __contains__(self, item):
+        return item in self.positions and item not in self.removed
+
+    def __iter__(self):
+        return (item for item in self.items if item not in self.removed)
+
+    def remove(self, item):
+        if item not in self:
+            raise KeyError(item)
+        self.removed.add(item)
+        self.sampler.remove(self.positions[item])
+
+    def discard(self, item):
+        if item in self:
+            self.remove(item)
+
+    def sample(self):
+        return self.items[self.sampler.sample()]
+
+def load_api_weights(weights_file):
+    """
+    Load per-api popularity scores from a json object {api_name: score} or a csv file whose
+    first two columns are the api name and its score.
+    """
+    if not os.path.exists(weights_file):
+        raise FileNotFoundError(f"Weights file not found: {weights_file}")
+    if weights_file.endswith('.json'):
+        with open(weights_file, 'r') as f:
+            return {api_name: float(score) for api_name, score in json.load(f).items()}
+    weights = {}
+    with open(weights_file, 'r') as f:
+        reader = csv.reader(f)
+        for row in reader:
+            try:
+                weights[row[0]] = float(row[1])
+            except (IndexError, ValueError):
+                continue  # header or malformed row
+    return weights
+
 class CTAPICoverage(object):
-    def __init__(self, apis_names_list, apis_details_list, n):
+    def __init__(self, apis_names_list, apis_details_list, n, weights=None, compat=None):
+        """
+        `compat` is an optional `CompatibilityIndex`; only the combinations it deems feasible
+        are enumerated, sampled and counted in the coverage.
+        """
         self.apis_details_list = apis_details_list
         self.n = n
+        self.apis_names_list = sorted(set(apis_names_list))
+        self.weights = self.normalize_weights(weights)
+        self.compat = compat
         # self.all_combinations = set(combinations(apis_names_list, n))
-        self.all_combinations = parallel_combinations(apis_names_list, n)
+        if compat is None:
+            self.all_combinations = parallel_combinations(apis_names_list, n)
+        else:
+            self.all_combinations = set(compat.iter_feasible(n))
         self.covered = set()
-        self.uncovered = self.all_combinations - self.covered
+        if self.weights is None:
+            self.uncovered = UncoveredPool(self.all_combinations - self.covered)
+        else:
+            self.uncovered = WeightedPool(self.all_combinations - self.covered, self.combination_weight)
     
     @classmethod
-    def from_csv(cls, api_file_path, n):
+    def from_csv(cls, api_file_path, n, weight_column=None, weights_file=None, prune_infeasible=False):
+        """
+        Weights steer the selection towards popular apis. They are read from `weight_column`
+        of the api file, or from an external `weights_file` (see `load_api_weights`).
+        With `prune_infeasible`, combinations rejected by a `CompatibilityIndex` built from the
+        api signatures are excluded from the combination space.
+        """
         if not os.path.exists(api_file_path):
             raise FileNotFoundError(f"API file not found: {api_file_path}")
 
         apis_names_list = []
         apis_details_list = {}
+        weights = load_api_weights(weights_file) if weights_file else None
         with open(api_file_path, 'r') as f:
             reader = csv.DictReader(f)
+            if weight_column is not None and weight_column not in (reader.fieldnames or ()):
+                raise KeyError(f"Column {weight_column} not found in {api_file_path}")
             for row in reader:
                 apis_names_list.append(row['api_name'])
                 apis_details_list[row['api_name']] = {
@@ -58,7 +338,27 @@ class CTAPICoverage(object):
                         'parameters': row['parameters'], 
                         'examples': row['examples']
                 }
-        return cls(apis_names_list, apis_details_list, n)
+                if weight_column is not None and row[weight_column]:
+                    weights = weights if weights is not None else {}
+                    weights[row['api_name']] = float(row[weight_column])
+        compat = CompatibilityIndex(apis_details_list) if prune_infeasible else None
+        return cls(apis_names_list, apis_details_list, n, weights=weights, compat=compat)
+
+    def normalize_weights(self, weights):
+        """Apis without a positive score get the smallest known score so they stay reachable."""
+        if not weights:
+            return None
+        positive = [w for api_name, w in weights.items() if w > 0 and api_name in self.apis_details_list]
+        floor = min(positive) if positive else 1.0
+        return {
+            api_name: weights[api_name] if weights.get(api_name, 0) > 0 else floor
+            for api_name in self.apis_names_list
+        }
+
+    def combination_weight(self, combination):
+        if self.weights is None:
+            return 1.0
+        return math.prod(self.weights[api_name] for api_name in combination)
 
     def generate_api_combination(self):
         """
@@ -76,21 +376,322 @@ class CTAPICoverage(object):
                 }
             }
         """
-        target_apis_names = random.choice(tuple(self.uncovered)) if self.uncovered else None
+        target_apis_names = self.uncovered.sample() if self.uncovered else None
+        return target_apis_names, self.get_api_details(target_apis_names)
+
+    def generate_api_selection(self, k, max_candidates=None):
+        """
+        Covering-array mode: greedily build a selection of up to `k` apis (AETG-style) that
+        covers as many uncovered n-way combinations as possible, so a single task credits
+        up to C(k, n) combinations through `update_coverage`.
+
+        The selection is seeded with a random uncovered combination and then extended, one
+        api at a time, with the candidate that adds the most uncovered combinations (by
+        weight, if the coverage is popularity-weighted). Only
+        `max_candidates` random candidates are scored per step if given, otherwise all apis.
+        It stops early once no candidate adds anything new.
+
+        Return: the same (target_apis_names, target_apis_details) pair as `generate_api_combination`.
+        """
+        seed, _ = self.generate_api_combination()
+        if seed is None:
+            return None, {}
+        selection = list(seed)
+        while len(selection) < k:
+            candidates = [api_name for api_name in self.apis_names_list if api_name not in selection]
+            if max_candidates is not None and len(candidates) > max_candidates:
+                candidates = random.sample(candidates, max_candidates)
+            random.shuffle(candidates)
+            best, best_gain = None, 0
+            for candidate in candidates:
+                gain = sum(
+                    self.combination_weight(sub + (candidate,))
+                    for sub in combinations(selection, self.n - 1)
+                    if self.is_feasible(sub + (candidate,)) and not self.is_covered(sub + (candidate,))
+                )
+                if gain > best_gain:
+                    best, best_gain = candidate, gain
+            if best is None:
+                break
+            selection.append(best)
+        target_apis_names = tuple(sorted(selection))
+        return target_apis_names, self.get_api_details(target_apis_names)
+
+    def get_api_details(self, api_names):
         target_apis_details = {}
-        for api_name in target_apis_names:
+        for api_name in api_names or ():
             target_apis_details[api_name] = self.apis_details_list[api_name]
-        return target_apis_names, target_apis_details
+        return target_apis_details
 
     def calculate_coverage(self):
         total = len(self.all_combinations)
         covered = len(self.covered)
         return covered / total * 100 if total > 0 else 0.0
 
+    def is_feasible(self, combination):
+        return self.compat is None or self.compat.is_feasible(combination)
+
+    def is_covered(self, combination):
+        return tuple(sorted(combination)) in self.covered
+
+    def update_coverage(self, combination):
+        """
+        Credit `combination`. A selection with more than n apis (see `generate_api_selection`)
+        credits every n-way combination inside it.
+        """
+        for sub in combinations(sorted(set(combination)), self.n):
+            if sub in self.all_combinations:
+                self.covered.add(sub)
+                self.uncovered.discard(sub)
+
+    @cached_property
+    def qualified_index(self):
+        """Api names by their dotted name, e.g. 'numpy.random.Generator' -> ['class numpy.random.Generator(bit_generator)']."""
+        index = {}
+        for api_name in self.apis_names_list:
+            index.setdefault(qualified_name(api_name), []).append(api_name)
+        return index
+
+    def observed_combination(self, called):
+        """The apis among `called`, the public names a `CallTracer` recorded during execution."""
+        return tuple(sorted({api_name for name in called for api_name in self.qualified_index.get(name, ())}))
+
+    def update_coverage_from_calls(self, called):
+        """
+        Credit the apis the code actually called instead of the ones the task asked for:
+        every n-way combination among them is covered. Returns the observed apis.
+        """
+        observed = self.observed_combination(called)
+        self.update_coverage(observed)
+        return observed
+
+    def credit_solution(self, combination, result=None):
+        """
+        Credit a solved task: the apis its code called if `result` (an `ExecutionResult`)
+        was traced, else the requested `combination`. Returns the credited apis.
+        """
+        if result is not None and result.called is not None:
+            return self.update_coverage_from_calls(result.called)
+        self.update_coverage(combination)
+        return tuple(combination)
+
+class ImplicitCTAPICoverage(CTAPICoverage):
+    """
+    The same coverage criterion as `CTAPICoverage`, but the combination space is never
+    materialized. Every combination is addressed by its rank in the combinatorial number
+    system over the sorted api list, and covered ranks are kept in a `CoverageBitmap`,
+    so memory stays near C(N, n) / 8 bytes.
+    """
+    # Rejection sampling is used until at most `max_pool` feasible owned ranks are unset. They
+    # are then collected once into an `UncoveredPool`, so the pool never holds more than
+    # `max_pool` ranks whatever the size of the space.
+    max_pool = 1 << 18
+
+    def __init__(self, apis_names_list, apis_details_list, n, weights=None, compat=None):
+        self.apis_details_list = apis_details_list
+        self.n = n
+        self.apis_names_list = sorted(set(apis_names_list))
+        self.weights = self.normalize_weights(weights)
+        self.compat = compat
+        self.api_index = {api_name: i for i, api_name in enumerate(self.apis_names_list)}
+        self.total = math.comb(len(self.apis_names_list), n)
+        # Infeasible ranks stay in the rank space but are never sampled, credited or counted
+        self.feasible_total = self.total if compat is None else compat.count_feasible(n)
+        # Can be swapped for a persisted bitmap, see `lcmeval.test_generation.checkpoint`
+        self.covered = CoverageBitmap(self.total)
+        self.uncovered = None
+        # Built lazily: one float per rank, so only affordable for moderate C(N, n)
+        self.weighted = None
+        # (index, count, mode), see `set_shard`
+        self.shard = None
+        self.owned_covered = None
+        # The feasible ranks of a pruned shard, counted once by `set_shard`
+        self.owned_feasible = None
+
+    def set_shard(self, index, count, mode='range'):
+        """
+        Restrict sampling and `calculate_coverage` to a static slice of the combination space,
+        so that `count` nodes can share a campaign without overlapping. Slices are made of whole
+        bitmap bytes: with 'range' node `index` owns a contiguous run of bytes, with 'interleave'
+        it owns every `count`-th byte, which spreads every node over all apis. Per-node bitmaps
+        are combined with `lcmeval.test_generation.checkpoint.merge_checkpoints`.
+
+        A pruned space (`compat` set) can only be split by 'range': the feasible ranks of a
+        contiguous slice are counted from its bounds, those of an interleaved one are not.
+        """
+        if mode not in ('range', 'interleave'):
+            raise ValueError(f"Unknown shard mode: {mode}")
+        if not 0 <= index < count:
+            raise ValueError(f"Shard index {index} out of range for {count} shards")
+        if self.compat is not None and mode != 'range':
+            raise ValueError("A pruned combination space can only be sharded with mode='range'")
+        self.shard = (index, count, mode)
+        self.owned_feasible = None
+        if self.compat is not None:
+            owned = self.owned_bytes()
+            start, stop = owned.start * 8, min(owned.stop * 8, self.total)
+            self.owned_feasible = (self.compat.count_feasible_below(self.n, stop)
+                                   - self.compat.count_feasible_below(self.n, start))
+        self.uncovered = None
+        self.weighted = None
+        self.owned_covered = None
+
+    def owned_bytes(self):
+        nbytes = self.covered.nbytes
+        if self.shard is None:
+            return range(nbytes)
+        index, count, mode = self.shard
+        if mode == 'range':
+            return range(nbytes * index // count, nbytes * (index + 1) // count)
+        return range(index, nbytes, count)
+
+    def owns(self, rank):
+        return self.shard is None or (rank >> 3) in self.owned_bytes()
+
+    def owned_ranks(self):
+        """The size of the owned slice of the rank space, infeasible ranks included."""
+        if self.shard is None:
+            return self.total
+        owned = self.owned_bytes()
+        # The last bitmap byte may hold fewer than 8 ranks
+        padding = self.covered.nbytes * 8 - self.total
+        return len(owned) * 8 - (padding if self.covered.nbytes - 1 in owned else 0)
+
+    def owned_total(self):
+        if self.shard is None:
+            return self.feasible_total
+        if self.owned_feasible is not None:
+            return self.owned_feasible
+        return self.owned_ranks()
+
+    def iter_owned_clear(self):
+        """Yield the unset owned ranks in increasing order."""
+        owned = self.owned_bytes()
+        if owned.step == 1:
+            yield from self.covered.iter_clear(owned.start, owned.stop)
+            return
+        # Interleaved bytes are gathered into one compact copy, scanned like a bitmap
+        compact = CoverageBitmap(len(owned) * 8, bytearray(self.covered.buffer[owned.start:owned.stop:owned.step]), 0)
+        for rank in compact.iter_clear():
+            rank = (owned[rank >> 3] << 3) | (rank & 7)
+            if rank < self.total:
+                yield rank
+
+    def iter_feasible_clear(self):
+        """
+        Yield the unset feasible owned ranks of a pruned space in increasing order. The
+        combinations sharing their top indices hold a contiguous run of ranks, so runs that
+        are entirely set or outside the owned slice are skipped without visiting them; the
+        infeasible ranks, which stay unset forever, are never unranked.
+        """
+        owned = self.owned_bytes()
+        lo, hi = owned.start * 8, min(owned.stop * 8, self.total)
+        adjacency = self.compat.adjacency
+
+        def extend(k, base, candidates):
+            allowed = candidates
+            while candidates:
+                low = candidates & -candidates
+                t = low.bit_length() - 1
+                candidates ^= low
+                # Combinations whose next index is t: ranks [start, stop)
+                start, stop = base + math.comb(t, k), base + math.comb(t + 1, k)
+                if start >= hi:
+                    return
+                if stop <= lo or self.covered.is_full(start, stop):
+                    continue
+                if k == 1:
+                    yield start
+                else:
+                    yield from extend(k - 1, start, (low - 1) & adjacency[t] & allowed)
+
+        yield from extend(self.n, 0, (1 << len(self.apis_names_list)) - 1)
+
+    def owned_covered_count(self):
+        if self.shard is None:
+            return len(self.covered)
+        if self.owned_covered is None:
+            owned = self.owned_bytes()
+            chunk = bytes(self.covered.buffer[owned.start:owned.stop:owned.step])
+            self.owned_covered = int.from_bytes(chunk, 'little').bit_count()
+        return self.owned_covered
+
+    def random_owned_rank(self):
+        if self.shard is None:
+            return random.randrange(self.total)
+        owned = self.owned_bytes()
+        while True:
+            rank = (owned[random.randrange(len(owned))] << 3) | random.randrange(8)
+            if rank < self.total:
+                return rank
+
+    def build_weighted_sampler(self):
+        weights = array('d', bytes(8 * self.total))
+        index_weights = [self.weights[api_name] for api_name in self.apis_names_list]
+        for indices in combinations(range(len(self.apis_names_list)), self.n):
+            rank = comb_rank(indices)
+            if rank in self.covered or not self.owns(rank):
+                continue
+            if self.is_feasible([self.apis_names_list[i] for i in indices]):
+                weights[rank] = math.prod(index_weights[i] for i in indices)
+        return FenwickSampler(weights)
+
+    def rank(self, combination):
+        indices = {self.api_index[api_name] for api_name in combination}
+        if len(indices) != self.n:
+            raise ValueError(f"Expected {self.n} distinct apis, got {combination}")
+        return comb_rank(indices)
+
+    def unrank(self, rank):
+        return tuple(self.apis_names_list[i] for i in comb_unrank(rank, self.n, len(self.apis_names_list)))
+
+    def is_feasible_rank(self, rank):
+        return self.compat is None or self.compat.is_feasible(self.unrank(rank))
+
+    def generate_api_combination(self):
+        total = self.owned_total()
+        if self.owned_covered_count() >= total:
+            return None, {}
+        if self.weights is not None:
+            if self.weighted is None:
+                self.weighted = self.build_weighted_sampler()
+            target_apis_names = self.unrank(self.weighted.sample())
+            return target_apis_names, self.get_api_details(target_apis_names)
+        if self.uncovered is None and total - self.owned_covered_count() <= self.max_pool:
+            ranks = self.iter_owned_clear() if self.compat is None else self.iter_feasible_clear()
+            self.uncovered = UncoveredPool(ranks)
+        if self.uncovered is not None:
+            if not self.uncovered:
+                return None, {}
+            rank = self.uncovered.sample()
+        else:
+            rank = self.random_owned_rank()
+            while rank in self.covered or not self.is_feasible_rank(rank):
+                rank = self.random_owned_rank()
+        target_apis_names = self.unrank(rank)
+        return target_apis_names, self.get_api_details(target_apis_names)
+
+    def calculate_coverage(self):
+        """The coverage of the whole space, or of the owned slice if `set_shard` was called."""
+        total = self.owned_total()
+        return self.owned_covered_count() / total * 100 if total > 0 else 0.0
+
+    def is_covered(self, combination):
+        return self.rank(combination) in self.covered
+
     def update_coverage(self, combination):
-        if combination in self.all_combinations:
-            self.covered.add(combination)
-            self.uncovered.remove(combination)
+        known = [api_name for api_name in set(combination) if api_name in self.api_index]
+        for sub in combinations(known, self.n):
+            if not self.is_feasible(sub):
+                continue
+            rank = self.rank(sub)
+            if self.covered.add(rank):
+                if self.owned_covered is not None and self.owns(rank):
+                    self.owned_covered += 1
+                if self.uncovered is not None:
+                    self.uncovered.discard(rank)
+                if self.weighted is not None:
+                    self.weighted.remove(rank)
 
 if __name__ == "__main__":
     coverge = CTAPICoverage.from_csv("/home/test/program/TestCodeGenModel/lcmeval/crawler/numpy_apis/apis.csv", 1)
@@ -0,0 +1,174 @@
+# coding=utf-8
+"""
+A coverage tracker shared by several worker processes on one host.
+
+The covered and claimed bitmaps live in one `multiprocessing.shared_memory` segment. A worker
+claims a combination before asking the LLM for it and then either commits it (covered) or
+releases it (on failure), so no two workers spend LLM calls on the same combination.
+Updates are guarded by striped locks: every byte of the bitmaps maps to one of `stripes`
+locks, so workers only contend when they touch the same stripe.
+
+Segment layout: `stripes` int64 covered counters | covered bitmap | claimed bitmap.
+"""
+import multiprocessing
+import random
+from itertools import combinations
+from multiprocessing import shared_memory
+from lcmeval.test_generation.coverage import CoverageBitmap, ImplicitCTAPICoverage
+
+
+class StripedBitmap(CoverageBitmap):
+    """A `CoverageBitmap` over shared memory whose count is kept per lock stripe."""
+    def __init__(self, size, buffer, counts, locks):
+        super().__init__(size, buffer, count=0)
+        self.counts = counts
+        self.locks = locks
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def stripe(self, rank):
+        return (rank >> 3) % len(self.locks)
+
+    def add(self, rank):
+        stripe = self.stripe(rank)
+        with self.locks[stripe]:
+            if rank in self:
+                return False
+            self.buffer[rank >> 3] |= 1 << (rank & 7)
+            self.counts[stripe] += 1
+            return True
+
+
+class SharedCTAPICoverage(ImplicitCTAPICoverage):
+    """
+    An `ImplicitCTAPICoverage` whose state is shared between processes. Create it in the
+    parent and hand it to the workers as a `multiprocessing.Process` (or `Pool` initializer)
+    argument; the locks can only be inherited that way. The creating process owns the
+    segment and should call `unlink()` once all workers are done.
+
+    In the workers, `generate_api_combination` claims the returned combination,
+    `update_coverage` commits it and `release` gives it back to the pool.
+    """
+    # Random probes before falling back to a scan for an unclaimed rank
+    max_probes = 64
+
+    def __init__(self, apis_names_list, apis_details_list, n, weights=None, compat=None, stripes=64):
+        if weights:
+            raise ValueError("Weighted sampling is not supported by SharedCTAPICoverage")
+        super().__init__(apis_names_list, apis_details_list, n, compat=compat)
+        self.stripes = stripes
+        self.locks = [multiprocessing.Lock() for _ in range(stripes)]
+        nbytes = self.covered.nbytes
+        self.shm = shared_memory.SharedMemory(create=True, size=8 * stripes + 2 * nbytes)
+        self.shm.buf[:] = bytes(len(self.shm.buf))
+        self.attach()
+
+    def attach(self):
+        nbytes = (self.total + 7) // 8
+        offset = 8 * self.stripes
+        counts = self.shm.buf[:offset].cast('q')
+        self.covered = StripedBitmap(self.total, self.shm.buf[offset:offset + nbytes], counts, self.locks)
+        self.claimed = CoverageBitmap(self.total, self.shm.buf[offset + nbytes:offset + 2 * nbytes], count=0)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ('shm', 'covered', 'claimed'):
+            del state[key]
+        state['shm_name'] = self.shm.name
+        return state
+
+    def __setstate__(self, state):
+        shm_name = state.pop('shm_name')
+        self.__dict__.update(state)
+        self.shm = shared_memory.SharedMemory(name=shm_name)
+        self.attach()
+
+    def try_claim(self, rank):
+        if not self.is_feasible_rank(rank):
+            return False
+        byte, mask = rank >> 3, 1 << (rank & 7)
+        with self.locks[self.covered.stripe(rank)]:
+            if (self.covered.buffer[byte] | self.claimed.buffer[byte]) & mask:
+                return False
+            self.claimed.buffer[byte] |= mask
+            return True
+
+    def find_unclaimed(self):
+        """Scan the bitmaps from a random byte for a rank that is neither covered nor claimed."""
+        nbytes = self.covered.nbytes
+        start = random.randrange(nbytes)
+        for offset in range(nbytes):
+            byte = (start + offset) % nbytes
+            taken = self.covered.buffer[byte] | self.claimed.buffer[byte]
+            if taken == 0xFF:
+                continue
+            for bit in range(8):
+                rank = (byte << 3) | bit
+                if rank < self.total and not taken & (1 << bit) and self.try_claim(rank):
+                    return rank
+        return None
+
+    def generate_api_combination(self):
+        if len(self.covered) >= self.feasible_total:
+            return None, {}
+        for _ in range(self.max_probes):
+            rank = random.randrange(self.total)
+            if rank not in self.covered and rank not in self.claimed and self.try_claim(rank):
+                break
+        else:
+            rank = self.find_unclaimed()
+            if rank is None:
+                return None, {}
+        target_apis_names = self.unrank(rank)
+        return target_apis_names, self.get_api_details(target_apis_names)
+
+    def update_coverage(self, combination):
+        """Commit `combination` (and every n-way combination inside it) and drop its claims."""
+        super().update_coverage(combination)
+        self.release(combination)
+
+    def release(self, combination):
+        """Give the claims on `combination` back to the pool, e.g. after a failed generation."""
+        known = [api_name for api_name in set(combination) if api_name in self.api_index]
+        for sub in combinations(known, self.n):
+            rank = self.rank(sub)
+            with self.locks[self.covered.stripe(rank)]:
+                self.claimed.buffer[rank >> 3] &= ~(1 << (rank & 7)) & 0xFF
+
+    def close(self):
+        self.covered.counts.release()
+        self.covered.buffer.release()
+        self.claimed.buffer.release()
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        self.shm.unlink()
+
+
+def _worker(coverage, results):
+    claimed = []
+    while True:
+        target_apis_names, _ = coverage.generate_api_combination()
+        if target_apis_names is None:
+            break
+        claimed.append(target_apis_names)
+        coverage.update_coverage(target_apis_names)
+    results.put(claimed)
+    coverage.close()
+
+
+if __name__ == "__main__":
+    api_names = [f"api_{i}" for i in range(40)]
+    coverage = SharedCTAPICoverage(api_names, {api_name: {} for api_name in api_names}, 2)
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_worker, args=(coverage, results)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    claimed = [combination for _ in workers for combination in results.get()]
+    for worker in workers:
+        worker.join()
+    print(f"Claimed {len(claimed)} combinations, {len(set(claimed))} distinct, total {coverage.total}")
+    print(f"Coverage: {coverage.calculate_coverage()}")
+    coverage.unlink()
@@ -5,13 +5,19 @@ from .config import (
     update_config,
     dump_config,
 )
+from .cache import CompletionCache
+from .telemetry import TELEMETRY, Telemetry
 from .llm import (
     Completion,
     Usage,
     APITimeoutError,
     LLM,
+    AsyncLLM,
     dump_completion,
 )
+from .batch import BatchLLM, BatchFailed, BatchPending, process_batch_file
+from .mock import MockLLM, AsyncMockLLM
+from .backend import BACKENDS, ASYNC_BACKENDS, make_llm, make_async_llm
 
 __all__ = [
     'timestamp',
@@ -20,9 +26,23 @@ __all__ = [
     'CONFIG',
     'update_config',
     'dump_config',
+    'CompletionCache',
+    'TELEMETRY',
+    'Telemetry',
     'Completion',
     'Usage',
     'APITimeoutError',
     'LLM',
+    'AsyncLLM',
     'dump_completion',
+    'BatchLLM',
+    'BatchPending',
+    'BatchFailed',
+    'process_batch_file',
+    'MockLLM',
+    'AsyncMockLLM',
+    'BACKENDS',
+    'ASYNC_BACKENDS',
+    'make_llm',
+    'make_async_llm',
 ]
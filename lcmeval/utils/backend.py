@@ -0,0 +1,34 @@
+from typing import Dict, Optional, Type
+from .config import CONFIG
+from .llm import LLM, AsyncLLM
+from .batch import BatchLLM
+from .mock import MockLLM, AsyncMockLLM
+
+__all__ = ['BACKENDS', 'ASYNC_BACKENDS', 'make_llm', 'make_async_llm']
+
+# LLM backends selectable through `CONFIG["backend"]`
+BACKENDS: Dict[str, Type[LLM]] = {
+    "openai": LLM,
+    "batch": BatchLLM,
+    "mock": MockLLM,
+}
+
+# Backends with an asyncio variant, used by the pipelined drivers
+ASYNC_BACKENDS: Dict[str, Type[AsyncLLM]] = {
+    "openai": AsyncLLM,
+    "mock": AsyncMockLLM,
+}
+
+
+def make_llm(system_prompt: str) -> LLM:
+    backend = CONFIG["backend"]
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {backend}, expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[backend](system_prompt=system_prompt)
+
+
+def make_async_llm(system_prompt: str, concurrency: Optional[int] = None) -> AsyncLLM:
+    backend = CONFIG["backend"]
+    if backend not in ASYNC_BACKENDS:
+        raise ValueError(f"LLM backend {backend} has no asyncio variant, expected one of {', '.join(ASYNC_BACKENDS)}")
+    return ASYNC_BACKENDS[backend](system_prompt=system_prompt, concurrency=concurrency)
@@ -0,0 +1,169 @@
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, Optional, Sequence
+from .config import CONFIG
+from .llm import LLM, Completion
+from .telemetry import TELEMETRY
+
+__all__ = ['BatchPending', 'BatchFailed', 'BatchLLM', 'process_batch_file']
+
+
+class BatchPending(Exception):
+    """Raised when a request has been queued for the offline batch and has no result yet."""
+    def __init__(self, custom_id: str):
+        super().__init__(f"Request {custom_id} is queued for the offline batch")
+        self.custom_id = custom_id
+
+
+class BatchFailed(Exception):
+    """Raised when the ingested batch results hold an error for a request."""
+    def __init__(self, custom_id: str, error):
+        super().__init__(f"Batch request {custom_id} failed: {error}")
+        self.custom_id = custom_id
+        self.error = error
+
+
+def batch_paths():
+    return (
+        os.path.join(CONFIG["runs_dir"], "batch_requests.jsonl"),
+        os.path.join(CONFIG["runs_dir"], "batch_results.jsonl"),
+    )
+
+
+class BatchStore:
+    """
+    The queued requests and ingested results of one batch, shared by every `BatchLLM` of the
+    process. Results are reloaded whenever the results file changes on disk.
+    """
+    _stores: Dict[str, 'BatchStore'] = {}
+
+    def __init__(self, requests_path: str, results_path: str):
+        self.requests_path = requests_path
+        self.results_path = results_path
+        self.queued = set()
+        self.results: Dict[str, dict] = {}
+        self.results_mtime = 0.0
+        if os.path.exists(requests_path):
+            with open(requests_path) as f:
+                self.queued = {json.loads(line)["custom_id"] for line in f if line.strip()}
+
+    @classmethod
+    def of(cls, requests_path: str, results_path: str) -> 'BatchStore':
+        key = f"{requests_path}\n{results_path}"
+        if key not in cls._stores:
+            cls._stores[key] = cls(requests_path, results_path)
+        return cls._stores[key]
+
+    def refresh(self):
+        if not os.path.exists(self.results_path):
+            return
+        mtime = os.path.getmtime(self.results_path)
+        if mtime == self.results_mtime:
+            return
+        with open(self.results_path) as f:
+            for line in f:
+                if line.strip():
+                    item = json.loads(line)
+                    self.results[item["custom_id"]] = item
+        self.results_mtime = mtime
+
+    def enqueue(self, custom_id: str, body: dict):
+        if custom_id in self.queued:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.requests_path)), exist_ok=True)
+        with open(self.requests_path, "a") as f:
+            f.write(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": body,
+            }, ensure_ascii=False) + "\n")
+        self.queued.add(custom_id)
+
+
+class BatchLLM(LLM):
+    """
+    An `LLM` backend for two-phase offline campaigns. `query` looks the request up in the
+    ingested results (OpenAI Batch output format) by its content-addressed `custom_id`; if it
+    is not there yet, the request is appended to the batch input JSONL and `BatchPending` is
+    raised, so the driver can move on to the next task.
+
+    Phase 1 runs the pipeline and collects requests; the file is then submitted (or processed
+    by `process_batch_file`), and re-running the pipeline resolves the waiting ProbGen/CodeGen
+    steps from the results and queues the requests of their next steps.
+    """
+    def __init__(self, system_prompt: str, requests_path: Optional[str] = None, results_path: Optional[str] = None):
+        self.system_prompt = system_prompt
+        self.load_dotenv()
+        self.model = os.environ["MODEL_ID"]
+        default_requests, default_results = batch_paths()
+        self.store = BatchStore.of(requests_path or default_requests, results_path or default_results)
+        self.cache = None
+
+    def request_kwargs(self, prompt: str, n: int = 1) -> dict:
+        kwargs = super().request_kwargs(prompt, n)
+        kwargs.pop("timeout")
+        return kwargs
+
+    def query(self, prompt: str, stop_tags: Sequence[str] = (), stage: str = "", n: int = 1) -> Completion:
+        # Batches cannot stream, so `stop_tags` are ignored
+        custom_id = self.cache_key(prompt, n=n)
+        with TELEMETRY.track(stage) as record:
+            self.store.refresh()
+            item = self.store.results.get(custom_id)
+            if item is None:
+                self.store.enqueue(custom_id, self.request_kwargs(prompt, n))
+                raise BatchPending(custom_id)
+            response = item.get("response") or {}
+            if item.get("error") or response.get("status_code", 200) != 200:
+                raise BatchFailed(custom_id, item.get('error') or response.get('body'))
+            completion = Completion.model_validate(response["body"])
+            record.set_usage(completion.usage)
+        return completion
+
+
+def process_batch_file(requests_path: str, results_path: str, respond: Callable[[dict], Completion]):
+    """
+    A local stand-in for the batch service: answer every request of `requests_path` that has
+    no result yet with `respond(body)` and append the results to `results_path`.
+    """
+    done = set()
+    if os.path.exists(results_path):
+        with open(results_path) as f:
+            done = {json.loads(line)["custom_id"] for line in f if line.strip()}
+    processed = 0
+    with open(requests_path) as f, open(results_path, "a") as out:
+        for line in f:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            if request["custom_id"] in done:
+                continue
+            try:
+                completion = respond(request["body"])
+                result = {"response": {"status_code": 200, "body": completion.to_dict()}, "error": None}
+            except Exception as error:
+                result = {"response": None, "error": {"code": type(error).__name__, "message": str(error)}}
+            out.write(json.dumps({
+                "id": f"batch_req_{processed}_{int(time.time())}",
+                "custom_id": request["custom_id"],
+                **result,
+            }, ensure_ascii=False) + "\n")
+            done.add(request["custom_id"])
+            processed += 1
+    return processed
+
+
+if __name__ == "__main__":
+    # Process the queued batch of the current runs_dir against the configured endpoint
+    requests_path, results_path = batch_paths()
+    if len(sys.argv) == 3:
+        requests_path, results_path = sys.argv[1], sys.argv[2]
+    llm = LLM(system_prompt="")
+    count = process_batch_file(
+        requests_path, results_path,
+        lambda body: llm.client.chat.completions.create(**body, timeout=CONFIG["timeout"]),
+    )
+    print(f"Processed {count} requests from {requests_path} into {results_path}")
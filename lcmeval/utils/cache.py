@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Optional, Sequence
+from openai.types.chat.chat_completion import ChatCompletion as Completion
+from .config import CONFIG
+
+__all__ = ['CompletionCache', 'cache_key']
+
+
+def cache_key(model: str, system_prompt: str, prompt: str, max_tokens: int, stop_tags: Sequence[str] = (),
+              n: int = 1, temperature: float = 0.0) -> str:
+    """
+    The sha256 of everything that determines a temperature-0 completion. Streamed
+    completions truncated at `stop_tags` get their own keys, and so do requests sampling
+    `n` choices at `temperature`, which are replayed as sampled.
+    """
+    fields = [model, system_prompt, prompt, max_tokens]
+    if stop_tags:
+        fields.append(list(stop_tags))
+    if n > 1:
+        fields.append([n, temperature])
+    payload = json.dumps(fields, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    """
+    A content-addressed completion cache in a local SQLite file. Entries older than
+    `max_age` seconds are dropped, and once the stored completions exceed `max_bytes`
+    the least recently used ones are evicted. Eviction runs every `evict_every` writes.
+    """
+    evict_every = 100
+
+    def __init__(self, path: str, max_bytes: int = 0, max_age: int = 0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS completions ('
+            'key TEXT PRIMARY KEY, data TEXT NOT NULL, size INTEGER NOT NULL, '
+            'created REAL NOT NULL, accessed REAL NOT NULL)'
+        )
+
+    @classmethod
+    def from_config(cls) -> Optional['CompletionCache']:
+        """The cache configured by `CONFIG["cache_file"]`, or None if caching is disabled."""
+        if not CONFIG["cache_file"]:
+            return None
+        return cls(CONFIG["cache_file"], CONFIG["cache_max_bytes"], CONFIG["cache_max_age"])
+
+    def get(self, key: str) -> Optional[Completion]:
+        row = self.conn.execute('SELECT data, created FROM completions WHERE key = ?', (key,)).fetchone()
+        now = time.time()
+        if row is None or (self.max_age and now - row[1] > self.max_age):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute('UPDATE completions SET accessed = ? WHERE key = ?', (now, key))
+        return Completion.model_validate_json(row[0])
+
+    def put(self, key: str, completion: Completion):
+        data = completion.model_dump_json()
+        now = time.time()
+        self.conn.execute(
+            'INSERT OR REPLACE INTO completions (key, data, size, created, accessed) VALUES (?, ?, ?, ?, ?)',
+            (key, data, len(data), now, now),
+        )
+        self.writes += 1
+        if self.writes % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        if self.max_age:
+            self.conn.execute('DELETE FROM completions WHERE created < ?', (time.time() - self.max_age,))
+        if self.max_bytes:
+            self.conn.execute(
+                'DELETE FROM completions WHERE key IN ('
+                'SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed DESC) AS running FROM completions) '
+                'WHERE running > ?)',
+                (self.max_bytes,),
+            )
+
+    def __len__(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM completions').fetchone()[0]
+
+    def __str__(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0.0
+        return f'cache hits: {self.hits}, misses: {self.misses}, hit rate: {rate:.1f}%'
+
+    def close(self):
+        self.conn.close()
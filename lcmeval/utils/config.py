@@ -7,18 +7,80 @@ from .helper import timestamp
 
 class Config(TypedDict):
     runs_dir: str     # Directory for storing runs
+    backend: str      # LLM backend used by the agents, see `lcmeval.utils.backend`
     timeout: int      # Timeout for LLM API calls
     max_retries: int  # Maximum number of retries for API calls
+    rpm: int          # Requests per minute admitted by the rate limiter (0: no limit)
+    tpm: int          # Tokens per minute admitted by the rate limiter (0: no limit)
     max_tokens: int   # Maximum number of completion tokens
+    stream: bool      # Stream completions and stop at the closing tags the caller needs
+    concurrency: int  # Maximum number of in-flight requests, adapted down on rate limits
     env_file: str     # Path to the .env file
+    cache_file: str   # SQLite completion cache, empty to disable caching
+    cache_max_bytes: int  # Evict least recently used completions above this size (0: no limit)
+    cache_max_age: int    # Drop cached completions older than this many seconds (0: no limit)
+    probgen_max_rounds: int  # Maximum number of problem generations per api combination
+    probgen_max_tokens: int  # Token budget of the refinement of one api combination (0: no limit)
+    probgen_precheck: bool   # Check problems locally before sending them to the LLM judge
+    api_card_tokens: int     # Token budget of the compact api cards in prompts (0: raw crawled entries)
+    codegen_max_attempts: int   # Code generations per task while the code fails the static check
+    codegen_static_check: bool  # Check that generated code parses and references its apis
+    codegen_samples: int        # Candidates sampled in one request; above 1 the distinct ones are executed and vote
+    sample_temperature: float   # Temperature of requests that sample several choices
+    exec_workers: int        # Snippets executed in parallel (0: one per CPU)
+    exec_timeout: float      # Wall-clock limit of one snippet in seconds
+    exec_memory_mb: int      # Address space limit of one snippet
+    exec_cpu_seconds: int    # CPU time limit of one snippet
+    exec_warm: bool          # Fork snippets from warm workers with numpy preloaded
+    exec_trace: bool         # Record the numpy callables every snippet calls
+    exec_worker_jobs: int    # Replace a warm worker after this many snippets
+    exec_worker_rss_mb: int  # Replace a warm worker once its memory grows past this
+    exec_cache: bool         # Reuse the outcome of a snippet that already ran with the same code
+    exec_cache_file: str     # SQLite file of the execution cache, empty to keep it in memory
+    mock_script: str  # YAML rules of the mock backend ({match, response} items), empty for the defaults
+    mock_latency: float        # Mean simulated latency of the mock backend in seconds
+    mock_latency_sigma: float  # Shape of the lognormal latency distribution
+    mock_failure_rate: float   # Probability that a mock call times out
+    mock_seed: int             # Seed of the mock latency/failure draws
 
 
 CONFIG: Config = {
     "runs_dir": "runs",
+    "backend": "openai",
     "timeout": 120,
-    "max_retries": 0,
+    "max_retries": 5,
+    "rpm": 0,
+    "tpm": 0,
     "max_tokens": 4096,
+    "stream": False,
+    "concurrency": 16,
     "env_file": ".env",
+    "cache_file": "",
+    "cache_max_bytes": 1 << 30,
+    "cache_max_age": 30 * 24 * 3600,
+    "probgen_max_rounds": 5,
+    "probgen_max_tokens": 32000,
+    "probgen_precheck": True,
+    "api_card_tokens": 160,
+    "codegen_max_attempts": 3,
+    "codegen_static_check": True,
+    "codegen_samples": 1,
+    "sample_temperature": 0.8,
+    "exec_workers": 0,
+    "exec_timeout": 10.0,
+    "exec_memory_mb": 1024,
+    "exec_cpu_seconds": 10,
+    "exec_warm": True,
+    "exec_trace": True,
+    "exec_worker_jobs": 500,
+    "exec_worker_rss_mb": 512,
+    "exec_cache": True,
+    "exec_cache_file": "",
+    "mock_script": "",
+    "mock_latency": 0.0,
+    "mock_latency_sigma": 0.5,
+    "mock_failure_rate": 0.0,
+    "mock_seed": 0,
 }
 
 
@@ -28,6 +90,10 @@ def update_config(config: Config, kwargs: Dict[str, Any]):
             config[key] = value
     config["runs_dir"] = pathlib.Path(config["runs_dir"]).expanduser().resolve().as_posix()
     config["env_file"] = pathlib.Path(config["env_file"]).expanduser().resolve().as_posix()
+    if config["cache_file"]:
+        config["cache_file"] = pathlib.Path(config["cache_file"]).expanduser().resolve().as_posix()
+    if config["exec_cache_file"]:
+        config["exec_cache_file"] = pathlib.Path(config["exec_cache_file"]).expanduser().resolve().as_posix()
 
 
 def dump_config(config: Config):
@@ -1,30 +1,107 @@
 import os
+import time
 import yaml
+import asyncio
 from dataclasses import dataclass
+from typing import List, Optional, Sequence, Union
 from dotenv import find_dotenv, load_dotenv
-from openai import OpenAI, APITimeoutError
+from openai import OpenAI, AsyncOpenAI, APITimeoutError
 from openai.types import CompletionUsage
-from openai.types.chat.chat_completion import ChatCompletion as Completion
+from openai.types.chat import ChatCompletionChunk, ChatCompletionMessage
+from openai.types.chat.chat_completion import ChatCompletion as Completion, Choice
 from .config import CONFIG
+from .cache import CompletionCache, cache_key
+from .ratelimit import RateLimiter
+from .telemetry import TELEMETRY, CallRecord
 
 __all__ = [
     'Completion',
     'APITimeoutError',
     'LLM',
+    'AsyncLLM',
     'Usage',
     'dump_completion',
 ]
 
 
+class StreamCollector:
+    """
+    Accumulates a streamed completion and reports when every tag in `stop_tags` has been
+    seen, so the stream can be closed early. Tags inside a leading <think> block are ignored.
+    """
+    def __init__(self, stop_tags: Sequence[str]):
+        self.pending = list(stop_tags)
+        self.parts: List[str] = []
+        self.text = ""
+        self.chunks = 0
+        self.first_token_at: Optional[float] = None
+        self.id, self.model, self.created = "", "", 0
+        self.usage: Optional[CompletionUsage] = None
+        self.finish_reason = None
+
+    def feed(self, chunk: ChatCompletionChunk) -> bool:
+        self.id, self.model, self.created = chunk.id, chunk.model, chunk.created
+        if chunk.usage is not None:
+            self.usage = chunk.usage
+        if not chunk.choices:
+            return False
+        choice = chunk.choices[0]
+        self.finish_reason = choice.finish_reason or self.finish_reason
+        content = choice.delta.content
+        if not content:
+            return False
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        self.chunks += 1
+        # Only rescan the tail that can contain a tag completed by this chunk
+        start = max(0, len(self.text) - max(map(len, self.pending), default=0))
+        self.text += content
+        if self.text.lstrip().startswith("<think>"):
+            think_end = self.text.find("</think>")
+            if think_end < 0:
+                return False
+            start = max(start, think_end + len("</think>"))
+        self.pending = [tag for tag in self.pending if self.text.find(tag, start) < 0]
+        return not self.pending
+
+    def completion(self, prompt_tokens: int) -> Completion:
+        """
+        The collected text as a `Completion`. If the stream was closed before the server sent
+        its usage, completion tokens are counted as content chunks (about one token each) and
+        `prompt_tokens` (an estimate) is used for the prompt.
+        """
+        usage = self.usage or CompletionUsage(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=self.chunks,
+            total_tokens=prompt_tokens + self.chunks,
+        )
+        return Completion(
+            id=self.id,
+            object="chat.completion",
+            created=self.created,
+            model=self.model,
+            choices=[Choice(
+                index=0,
+                finish_reason=self.finish_reason or "stop",
+                message=ChatCompletionMessage(role="assistant", content=self.text),
+            )],
+            usage=usage,
+        )
+
+
 class LLM:
     def __init__(self, system_prompt: str):
         self.system_prompt = system_prompt
         self.load_dotenv()
+        # Retries are done by the rate limiter, which also adapts to 429s and timeouts
         self.client = OpenAI(
             api_key=os.environ["OPENAI_API_KEY"],
             base_url=os.environ["OPENAI_API_BASE"],
-            max_retries=CONFIG["max_retries"],
+            max_retries=0,
         )
+        self.model = os.environ["MODEL_ID"]
+        self.cache = CompletionCache.from_config()
+        self.limiter = RateLimiter.shared(os.environ["OPENAI_API_BASE"], self.model)
 
     def load_dotenv(self):
         key_missing = "OPENAI_API_KEY" not in os.environ
@@ -36,9 +113,9 @@ class LLM:
                 env_path = find_dotenv()
             load_dotenv(dotenv_path=env_path)
 
-    def query(self, prompt: str) -> Completion:
-        return self.client.chat.completions.create(
-            model=os.environ["MODEL_ID"],
+    def request_kwargs(self, prompt: str, n: int = 1) -> dict:
+        kwargs = dict(
+            model=self.model,
             messages=[
                 {"role": "system", "content": self.system_prompt},
                 {"role": "user", "content": prompt}
@@ -47,6 +124,141 @@ class LLM:
             timeout=CONFIG["timeout"],
             max_completion_tokens=CONFIG["max_tokens"],
         )
+        if n > 1:
+            # n choices at temperature 0 would all be the same
+            kwargs.update(n=n, temperature=CONFIG["sample_temperature"])
+        return kwargs
+
+    def stream_kwargs(self, prompt: str) -> dict:
+        kwargs = self.request_kwargs(prompt)
+        kwargs.update(stream=True, stream_options={"include_usage": True})
+        return kwargs
+
+    def cache_key(self, prompt: str, stop_tags: Sequence[str] = (), n: int = 1) -> str:
+        return cache_key(self.model, self.system_prompt, prompt, CONFIG["max_tokens"], stop_tags, n, CONFIG["sample_temperature"])
+
+    def estimate_tokens(self, prompt: str, n: int = 1) -> int:
+        """A rough upper bound of the tokens a request consumes, used for TPM admission."""
+        return (len(self.system_prompt) + len(prompt)) // 4 + n * CONFIG["max_tokens"]
+
+    def query(self, prompt: str, stop_tags: Sequence[str] = (), stage: str = "", n: int = 1) -> Completion:
+        """
+        With `stop_tags` and `CONFIG["stream"]`, the completion is streamed and the stream is
+        closed as soon as all `stop_tags` have arrived; the text ends with the chunk that
+        completed them. With `n` > 1, the completion has `n` sampled choices and is not
+        streamed. Every call is recorded in `TELEMETRY` under `stage`.
+        """
+        stop_tags = tuple(stop_tags) if CONFIG["stream"] and n == 1 else ()
+        with TELEMETRY.track(stage) as record:
+            if self.cache is not None:
+                key = self.cache_key(prompt, stop_tags, n)
+                completion = self.cache.get(key)
+                if completion is not None:
+                    record.cached = True
+                    record.set_usage(completion.usage)
+                    return completion
+            if stop_tags:
+                completion, record.retries = self.limiter.call(
+                    lambda: self.stream(prompt, stop_tags, record),
+                    self.estimate_tokens(prompt),
+                    record,
+                )
+            else:
+                kwargs = self.request_kwargs(prompt, n)
+                completion, record.retries = self.limiter.call(
+                    lambda: self.client.chat.completions.create(**kwargs),
+                    self.estimate_tokens(prompt, n),
+                    record,
+                )
+            record.set_usage(completion.usage)
+        if self.cache is not None:
+            self.cache.put(key, completion)
+        return completion
+
+    def stream(self, prompt: str, stop_tags: Sequence[str], record: Optional[CallRecord] = None) -> Completion:
+        collector = StreamCollector(stop_tags)
+        start = time.monotonic()
+        stream = self.client.chat.completions.create(**self.stream_kwargs(prompt))
+        try:
+            for chunk in stream:
+                if collector.feed(chunk):
+                    break
+        finally:
+            stream.close()
+        if record is not None and collector.first_token_at is not None:
+            record.ttft = collector.first_token_at - start
+        return collector.completion((len(self.system_prompt) + len(prompt)) // 4)
+
+
+class AsyncLLM(LLM):
+    """
+    An asyncio variant of `LLM` on `AsyncOpenAI`. Queries go through the endpoint's shared
+    `RateLimiter`, whose adaptive window keeps at most `CONFIG["concurrency"]` requests in
+    flight. Passing `concurrency` gives the instance a private limiter with that maximum.
+    """
+    def __init__(self, system_prompt: str, concurrency: Optional[int] = None):
+        self.system_prompt = system_prompt
+        self.load_dotenv()
+        self.client = AsyncOpenAI(
+            api_key=os.environ["OPENAI_API_KEY"],
+            base_url=os.environ["OPENAI_API_BASE"],
+            max_retries=0,
+        )
+        self.model = os.environ["MODEL_ID"]
+        self.cache = CompletionCache.from_config()
+        if concurrency is None:
+            self.limiter = RateLimiter.shared(os.environ["OPENAI_API_BASE"], self.model)
+        else:
+            self.limiter = RateLimiter(CONFIG["rpm"], CONFIG["tpm"], concurrency, CONFIG["max_retries"])
+
+    async def query(self, prompt: str, stop_tags: Sequence[str] = (), stage: str = "", n: int = 1) -> Completion:
+        stop_tags = tuple(stop_tags) if CONFIG["stream"] and n == 1 else ()
+        with TELEMETRY.track(stage) as record:
+            if self.cache is not None:
+                key = self.cache_key(prompt, stop_tags, n)
+                completion = self.cache.get(key)
+                if completion is not None:
+                    record.cached = True
+                    record.set_usage(completion.usage)
+                    return completion
+            if stop_tags:
+                completion, record.retries = await self.limiter.acall(
+                    lambda: self.stream(prompt, stop_tags, record),
+                    self.estimate_tokens(prompt),
+                    record,
+                )
+            else:
+                kwargs = self.request_kwargs(prompt, n)
+                completion, record.retries = await self.limiter.acall(
+                    lambda: self.client.chat.completions.create(**kwargs),
+                    self.estimate_tokens(prompt, n),
+                    record,
+                )
+            record.set_usage(completion.usage)
+        if self.cache is not None:
+            self.cache.put(key, completion)
+        return completion
+
+    async def stream(self, prompt: str, stop_tags: Sequence[str], record: Optional[CallRecord] = None) -> Completion:
+        collector = StreamCollector(stop_tags)
+        start = time.monotonic()
+        stream = await self.client.chat.completions.create(**self.stream_kwargs(prompt))
+        try:
+            async for chunk in stream:
+                if collector.feed(chunk):
+                    break
+        finally:
+            await stream.close()
+        if record is not None and collector.first_token_at is not None:
+            record.ttft = collector.first_token_at - start
+        return collector.completion((len(self.system_prompt) + len(prompt)) // 4)
+
+    async def query_many(self, prompts: Sequence[str], stop_tags: Sequence[str] = (), stage: str = "") -> List[Union[Completion, Exception]]:
+        """
+        Query all `prompts` concurrently (bounded by `concurrency`). The results are in the
+        order of `prompts`; a failed query yields its exception instead of a completion.
+        """
+        return await asyncio.gather(*(self.query(prompt, stop_tags, stage) for prompt in prompts), return_exceptions=True)
 
 
 @dataclass
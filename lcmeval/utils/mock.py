@@ -0,0 +1,196 @@
+import asyncio
+import math
+import random
+import re
+import time
+import yaml
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Sequence, Tuple
+from openai import APITimeoutError
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletionChunk
+from .config import CONFIG
+from .cache import CompletionCache
+from .llm import LLM, AsyncLLM, Completion
+from .ratelimit import RateLimiter
+
+__all__ = ['MockLLM', 'AsyncMockLLM', 'DEFAULT_RULES']
+
+# (pattern on the user prompt, response template) pairs; `{apis}` expands to the numpy apis
+# mentioned in the prompt. They produce answers ProbGen and CodeGen accept on first try.
+DEFAULT_RULES: List[Tuple[str, str]] = [
+    (r"Evaluate the following problem description",
+     "<evaluation>PASS</evaluation>\n<feedback>\nThe problem meets all criteria.\n</feedback>"),
+    (r"generate a problem based on <apis>",
+     "<thoughts>\nCombine {apis} in one task.\n</thoughts>\n\n"
+     "<response>\nUsing numpy, solve a small task with {apis}.\n</response>"),
+    (r"generate code to solve the task",
+     "<code>\nimport numpy\nimport numpy as np\n\nresult = [{apis}]\n</code>"),
+    (r"", "OK"),
+]
+
+API_LINE_PATTERN = re.compile(r"- api_name: (.+?)\n")
+API_PATTERN = re.compile(r"\b(?:numpy|np)(?:\.\w+)+")
+
+
+def load_rules(script_path: str) -> List[Tuple[str, str]]:
+    """Scripted rules from a YAML list of {match: <regex>, response: <template>}."""
+    with open(script_path) as f:
+        return [(item["match"], item["response"]) for item in yaml.safe_load(f) or []]
+
+
+class MockStream:
+    """A synchronous stream of `ChatCompletionChunk`s, like the one returned by `OpenAI`."""
+    def __init__(self, completion: Completion, chunk_size: int = 4):
+        self.completion = completion
+        self.chunk_size = chunk_size
+        self.closed = False
+
+    def chunk(self, content: Optional[str], finish_reason=None, usage=None) -> ChatCompletionChunk:
+        choices = [] if content is None and finish_reason is None else [{
+            "index": 0, "delta": {"content": content}, "finish_reason": finish_reason,
+        }]
+        return ChatCompletionChunk.model_validate({
+            "id": self.completion.id, "object": "chat.completion.chunk", "created": self.completion.created,
+            "model": self.completion.model, "choices": choices, "usage": usage,
+        })
+
+    def __iter__(self):
+        text = self.completion.choices[0].message.content or ""
+        for start in range(0, len(text), self.chunk_size):
+            if self.closed:
+                return
+            yield self.chunk(text[start:start + self.chunk_size])
+        yield self.chunk("", finish_reason="stop")
+        yield self.chunk(None, usage=self.completion.usage.model_dump())
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncMockStream(MockStream):
+    async def __aiter__(self):
+        for chunk in MockStream.__iter__(self):
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+
+class MockCompletions:
+    """
+    Stands in for `client.chat.completions`: answers from the rules after a latency drawn
+    from a lognormal distribution with the configured mean, and fails with an
+    `APITimeoutError` at the configured rate. Draws come from a seeded generator.
+    """
+    def __init__(self, rules: Sequence[Tuple[str, str]], latency: float, sigma: float, failure_rate: float, seed: int):
+        self.rules = [(re.compile(pattern), template) for pattern, template in rules]
+        self.latency = latency
+        self.sigma = sigma
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.slept = 0.0
+
+    def draw_latency(self) -> float:
+        if self.latency <= 0:
+            return 0.0
+        mu = math.log(self.latency) - self.sigma ** 2 / 2
+        return self.rng.lognormvariate(mu, self.sigma)
+
+    def respond(self, prompt: str) -> str:
+        # The api entries of a ProbGen prompt, else the apis a task mentions
+        apis = API_LINE_PATTERN.findall(prompt) or API_PATTERN.findall(prompt)
+        apis = ", ".join(dict.fromkeys(api.strip() for api in apis)) or "numpy"
+        for pattern, template in self.rules:
+            if pattern.search(prompt):
+                return template.format(apis=apis)
+        return ""
+
+    def draw(self) -> Tuple[float, bool]:
+        """Draw the latency of the next call and whether it fails."""
+        self.calls += 1
+        latency = self.draw_latency()
+        self.slept += latency
+        return latency, self.rng.random() < self.failure_rate
+
+    def completion(self, model: str, messages: List[dict], n: int = 1) -> Completion:
+        content = self.respond(messages[-1]["content"])
+        prompt_tokens = sum(len(message["content"]) for message in messages) // 4
+        completion_tokens = n * (len(content) // 4)
+        return Completion.model_validate({
+            "id": f"mock-{self.calls}", "object": "chat.completion", "created": int(time.time()), "model": model,
+            "choices": [
+                {"index": i, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}
+                for i in range(n)
+            ],
+            "usage": CompletionUsage(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            ).model_dump(),
+        })
+
+    def create(self, model: str, messages: List[dict], stream: bool = False, n: int = 1, **kwargs):
+        latency, fails = self.draw()
+        time.sleep(latency)
+        if fails:
+            raise APITimeoutError(request=None)
+        completion = self.completion(model, messages, n)
+        return MockStream(completion) if stream else completion
+
+
+class AsyncMockCompletions(MockCompletions):
+    async def create(self, model: str, messages: List[dict], stream: bool = False, n: int = 1, **kwargs):
+        latency, fails = self.draw()
+        await asyncio.sleep(latency)
+        if fails:
+            raise APITimeoutError(request=None)
+        completion = self.completion(model, messages, n)
+        return AsyncMockStream(completion) if stream else completion
+
+
+def mock_completions(cls):
+    rules = load_rules(CONFIG["mock_script"]) if CONFIG["mock_script"] else []
+    return cls(
+        rules + DEFAULT_RULES,
+        CONFIG["mock_latency"], CONFIG["mock_latency_sigma"], CONFIG["mock_failure_rate"], CONFIG["mock_seed"],
+    )
+
+
+class MockLLM(LLM):
+    """
+    A deterministic `LLM` backend that needs no endpoint or credentials. It keeps the cache,
+    rate limiter and telemetry of `LLM` and only replaces the client, so it measures the
+    pipeline's own overhead. Configured through the `mock_*` keys of `CONFIG`.
+    """
+    def __init__(self, system_prompt: str):
+        self.system_prompt = system_prompt
+        self.model = "mock"
+        self.completions = mock_completions(MockCompletions)
+        self.client = SimpleNamespace(chat=SimpleNamespace(completions=self.completions))
+        self.cache = CompletionCache.from_config()
+        self.limiter = RateLimiter.shared("mock", self.model)
+        # Simulated network latency per stage, to separate it from the pipeline's overhead
+        self.simulated: Dict[str, float] = {}
+
+    def query(self, prompt: str, stop_tags: Sequence[str] = (), stage: str = "", n: int = 1) -> Completion:
+        slept = self.completions.slept
+        try:
+            return super().query(prompt, stop_tags, stage, n)
+        finally:
+            self.simulated[stage] = self.simulated.get(stage, 0.0) + self.completions.slept - slept
+
+
+class AsyncMockLLM(AsyncLLM):
+    """The asyncio variant of `MockLLM`; calls wait on `asyncio.sleep`, so they overlap."""
+    def __init__(self, system_prompt: str, concurrency: Optional[int] = None):
+        self.system_prompt = system_prompt
+        self.model = "mock"
+        self.completions = mock_completions(AsyncMockCompletions)
+        self.client = SimpleNamespace(chat=SimpleNamespace(completions=self.completions))
+        self.cache = CompletionCache.from_config()
+        if concurrency is None:
+            self.limiter = RateLimiter.shared("mock", self.model)
+        else:
+            self.limiter = RateLimiter(CONFIG["rpm"], CONFIG["tpm"], concurrency, CONFIG["max_retries"])
@@ -0,0 +1,300 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+from openai import APIConnectionError, APIStatusError, APITimeoutError, RateLimitError
+from .config import CONFIG
+from .telemetry import CallRecord
+
+__all__ = ['TokenBucket', 'AIMDWindow', 'RateLimiter']
+
+T = TypeVar('T')
+
+
+class TokenBucket:
+    """
+    A token bucket refilled at `per_minute` tokens per minute, holding at most one minute of
+    budget. `reserve` takes the tokens right away, possibly going into debt, and returns how
+    long the caller has to wait before the reservation is covered.
+    """
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            self._refill(time.monotonic())
+            self.level -= amount
+            return max(0.0, -self.level / self.rate)
+
+    def adjust(self, amount: float):
+        """Correct an earlier reservation, e.g. with the actual token usage."""
+        if self.rate <= 0:
+            return
+        with self.lock:
+            self._refill(time.monotonic())
+            self.level = min(self.capacity, self.level - amount)
+
+
+class AIMDWindow:
+    """
+    An adaptive concurrency limit: it grows by about one slot per window of successful
+    requests (additive increase) and is multiplied by `decrease` on every rate limit or
+    timeout (multiplicative decrease), staying within [minimum, maximum].
+    """
+    def __init__(self, maximum: int, minimum: int = 1, decrease: float = 0.5):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.decrease = decrease
+        self.limit = float(maximum)
+        self.inflight = 0
+        # One lock and counter for both paths; async waiters park on a future of their own
+        # loop, so the window works from threads and from any number of event loops
+        self.cond = threading.Condition()
+        self.waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def has_slot(self) -> bool:
+        return self.inflight < max(self.minimum, int(self.limit))
+
+    def acquire(self):
+        with self.cond:
+            self.cond.wait_for(self.has_slot)
+            self.inflight += 1
+
+    def release(self):
+        with self.cond:
+            self.inflight -= 1
+            self.cond.notify_all()
+            waiters, self.waiters = self.waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(wake, future)
+            except RuntimeError:
+                # The waiter's loop is closed
+                pass
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.cond:
+                if self.has_slot():
+                    self.inflight += 1
+                    return
+                future = loop.create_future()
+                self.waiters.append((loop, future))
+            await future
+
+    async def release_async(self):
+        self.release()
+
+    def on_success(self):
+        self.limit = min(float(self.maximum), self.limit + 1.0 / max(self.limit, 1.0))
+
+    def on_backoff(self):
+        self.limit = max(float(self.minimum), self.limit * self.decrease)
+
+
+def wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """The delay requested by the server through `Retry-After`/`retry-after-ms`, if any."""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get('retry-after-ms'):
+        try:
+            return float(headers['retry-after-ms']) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        date = email.utils.parsedate_to_datetime(value)
+        return max(0.0, date.timestamp() - time.time()) if date else None
+
+
+def is_backoff_error(error: Exception) -> bool:
+    """Errors that signal overload: the concurrency window shrinks on them."""
+    return isinstance(error, (RateLimitError, APITimeoutError))
+
+
+def is_retryable(error: Exception) -> bool:
+    if is_backoff_error(error) or isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+class RateLimiter:
+    """
+    Admission control for one endpoint: token buckets on requests and tokens per minute,
+    an `AIMDWindow` on concurrency, and retries with full-jitter exponential backoff that
+    honours `Retry-After`. Every request first reserves its estimated tokens; the estimate is
+    corrected with the reported usage afterwards.
+    """
+    _shared: Dict[Tuple[str, str], 'RateLimiter'] = {}
+    base_delay = 0.5
+    max_delay = 60.0
+
+    def __init__(self, rpm: int = 0, tpm: int = 0, concurrency: int = 1, max_retries: int = 0):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.window = AIMDWindow(concurrency)
+        self.max_retries = max_retries
+        self.retries = 0
+        self.backoffs = 0
+
+    @classmethod
+    def shared(cls, base_url: str, model: str) -> 'RateLimiter':
+        """One limiter per (endpoint, model) in this process, configured from `CONFIG`."""
+        key = (base_url, model)
+        if key not in cls._shared:
+            cls._shared[key] = cls(CONFIG["rpm"], CONFIG["tpm"], CONFIG["concurrency"], CONFIG["max_retries"])
+        return cls._shared[key]
+
+    def admission_delay(self, tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def settle(self, tokens: int, result):
+        usage = getattr(result, 'usage', None)
+        if usage is not None:
+            self.tokens.adjust(usage.total_tokens - tokens)
+
+    def backoff_delay(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, retry_after(error) or 0.0)
+
+    def on_error(self, attempt: int, error: Exception) -> float:
+        """Return how long to wait before the next attempt, or re-raise if giving up."""
+        if attempt >= self.max_retries or not is_retryable(error):
+            raise error
+        if is_backoff_error(error):
+            self.backoffs += 1
+            self.window.on_backoff()
+        self.retries += 1
+        return self.backoff_delay(attempt, error)
+
+    def call(self, fn: Callable[[], T], tokens: int, record: Optional[CallRecord] = None) -> Tuple[T, int]:
+        """
+        Run `fn` under admission control, return its result and the number of retries.
+        `record.retries` is kept up to date as well, so a call that ends up failing still
+        reports the retries it went through.
+        """
+        attempt = 0
+        while True:
+            time.sleep(self.admission_delay(tokens))
+            self.window.acquire()
+            # The slot is given back however the call ends, KeyboardInterrupt included
+            try:
+                result = fn()
+            except Exception as error:
+                self.tokens.adjust(-tokens)
+                delay = self.on_error(attempt, error)
+            else:
+                delay = None
+            finally:
+                self.window.release()
+            if delay is None:
+                self.window.on_success()
+                self.settle(tokens, result)
+                return result, attempt
+            attempt += 1
+            if record is not None:
+                record.retries = attempt
+            time.sleep(delay)
+
+    async def acall(self, fn: Callable[[], Awaitable[T]], tokens: int,
+                    record: Optional[CallRecord] = None) -> Tuple[T, int]:
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.admission_delay(tokens))
+            await self.window.acquire_async()
+            # The slot is given back however the call ends, cancellation included
+            try:
+                result = await fn()
+            except Exception as error:
+                self.tokens.adjust(-tokens)
+                delay = self.on_error(attempt, error)
+            else:
+                delay = None
+            finally:
+                await self.window.release_async()
+            if delay is None:
+                self.window.on_success()
+                self.settle(tokens, result)
+                return result, attempt
+            attempt += 1
+            if record is not None:
+                record.retries = attempt
+            await asyncio.sleep(delay)
+
+
+if __name__ == "__main__":
+    # Drive an AsyncLLM against a local stub server that answers every third request with 429
+    import http.server
+    import json
+    import os
+    from .llm import AsyncLLM
+
+    class StubHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        calls = 0
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status, body, headers=()):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            for key, value in headers:
+                self.send_header(key, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            StubHandler.calls += 1
+            if StubHandler.calls % 3 == 0:
+                self.reply(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, [("Retry-After", "0.2")])
+                return
+            self.reply(200, {
+                "id": f"stub-{StubHandler.calls}", "object": "chat.completion", "created": 0, "model": request["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": request["messages"][-1]["content"]}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+            })
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ.update(
+        OPENAI_API_KEY="stub", MODEL_ID="stub",
+        OPENAI_API_BASE=f"http://127.0.0.1:{server.server_address[1]}/v1",
+    )
+    CONFIG.update({"rpm": 600, "max_retries": 5, "concurrency": 8})
+    llm = AsyncLLM(system_prompt="stub")
+    start = time.monotonic()
+    results = asyncio.run(llm.query_many([f"prompt {i}" for i in range(30)]))
+    failed = sum(isinstance(result, Exception) for result in results)
+    print(f"{len(results) - failed}/{len(results)} succeeded in {time.monotonic() - start:.2f}s, "
+          f"{StubHandler.calls} requests, {llm.limiter.retries} retries, {llm.limiter.backoffs} backoffs, "
+          f"final concurrency limit {llm.limiter.window.limit:.2f}")
+    server.shutdown()
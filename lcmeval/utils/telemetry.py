@@ -0,0 +1,134 @@
+import json
+import math
+import os
+import threading
+import time
+import yaml
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, List, Optional, Sequence
+from .config import CONFIG
+
+__all__ = ['CallRecord', 'Telemetry', 'TELEMETRY']
+
+
+@dataclass
+class CallRecord:
+    stage: str = ""
+    started: float = field(default_factory=time.time)
+    wall_time: float = 0.0
+    ttft: Optional[float] = None  # Time to first token, streamed calls only
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    retries: int = 0
+    cached: bool = False
+    error: Optional[str] = None
+
+    def set_usage(self, usage):
+        if usage is not None:
+            self.prompt_tokens = usage.prompt_tokens
+            self.completion_tokens = usage.completion_tokens
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """The q-th percentile (0-100) of `values` with linear interpolation."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    pos = (len(values) - 1) * q / 100
+    lo, hi = math.floor(pos), math.ceil(pos)
+    return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+
+def histogram(values: Sequence[float], base: float = 2.0, unit: float = 0.1) -> Dict[str, int]:
+    """Counts per log-scaled bucket: [0, unit), [unit, unit*base), [unit*base, unit*base^2), ..."""
+    counts: Dict[str, int] = {}
+    for value in values:
+        if value < unit:
+            key = f"<{unit:g}"
+        else:
+            exp = int(math.log(value / unit, base))
+            key = f"{unit * base ** exp:g}-{unit * base ** (exp + 1):g}"
+        counts[key] = counts.get(key, 0) + 1
+    return dict(sorted(counts.items(), key=lambda item: float(item[0].lstrip('<').split('-')[0])))
+
+
+class Telemetry:
+    """
+    Collects one `CallRecord` per LLM call and aggregates them per stage
+    (e.g. probgen-generate, probgen-evaluate, codegen).
+    """
+    quantiles = (50, 90, 99)
+
+    def __init__(self):
+        self.records: List[CallRecord] = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def track(self, stage: str) -> Iterator[CallRecord]:
+        """Time the enclosed call and record it, also when it raises."""
+        record = CallRecord(stage=stage)
+        start = time.monotonic()
+        try:
+            yield record
+        except BaseException as error:
+            record.error = type(error).__name__
+            raise
+        finally:
+            record.wall_time = time.monotonic() - start
+            with self.lock:
+                self.records.append(record)
+
+    def stats(self, values: Sequence[float]) -> Dict[str, float]:
+        result = {f"p{q}": round(percentile(values, q), 4) for q in self.quantiles}
+        result["max"] = round(max(values), 4) if values else 0.0
+        return result
+
+    def summary(self) -> Dict[str, dict]:
+        with self.lock:
+            records = list(self.records)
+        stages: Dict[str, List[CallRecord]] = {}
+        for record in records:
+            stages.setdefault(record.stage or "unlabeled", []).append(record)
+        summary = {}
+        for stage, items in stages.items():
+            live = [r for r in items if not r.cached and r.error is None]
+            # Cache hits replay the usage of an earlier call and are not billed again
+            billed = [r for r in items if not r.cached]
+            replayed = [r for r in items if r.cached]
+            wall_times = [r.wall_time for r in live]
+            summary[stage] = {
+                "calls": len(items),
+                "cached": sum(r.cached for r in items),
+                "errors": sum(r.error is not None for r in items),
+                "retries": sum(r.retries for r in items),
+                "prompt_tokens": sum(r.prompt_tokens for r in billed),
+                "completion_tokens": sum(r.completion_tokens for r in billed),
+                "cached_prompt_tokens": sum(r.prompt_tokens for r in replayed),
+                "cached_completion_tokens": sum(r.completion_tokens for r in replayed),
+                "wall_time_total": round(sum(wall_times), 4),
+                "wall_time": self.stats(wall_times),
+                "wall_time_histogram": histogram(wall_times),
+                "ttft": self.stats([r.ttft for r in live if r.ttft is not None]),
+            }
+        return summary
+
+    def dump(self, runs_dir: Optional[str] = None):
+        """Write every call to telemetry.jsonl and the per-stage summary to telemetry.yaml."""
+        runs_dir = runs_dir or CONFIG["runs_dir"]
+        os.makedirs(runs_dir, exist_ok=True)
+        with self.lock:
+            records = list(self.records)
+        with open(os.path.join(runs_dir, "telemetry.jsonl"), "w") as f:
+            for record in records:
+                f.write(json.dumps(asdict(record)) + "\n")
+        with open(os.path.join(runs_dir, "telemetry.yaml"), "w") as f:
+            yaml.dump(self.summary(), f, sort_keys=False)
+
+    def reset(self):
+        with self.lock:
+            self.records.clear()
+
+
+# Process-wide collector used by `LLM` and `AsyncLLM`
+TELEMETRY = Telemetry()